@@ -6,104 +6,428 @@ Flask-based visual viewer for the local bot SQLite database (bot.db).
 - If BOT_TOKEN is set in env, profile photos (file_id) are fetched from Telegram.
 
 Usage:
-    pip install -r requirements.txt   # needs flask + requests
-    python db_viewer.py
+    pip install -r requirements.txt   # needs flask + flask-compress + requests + orjson
+    python db_viewer.py               # local use (DEBUG=1 for the reloader)
+    gunicorn db_viewer:app -k gthread -w 2 --threads 16 -b 0.0.0.0:5000   # production
 Then open http://127.0.0.1:5000
 """
 
 from __future__ import annotations
 
-import json
+import base64
+import hashlib
 import os
+import queue
 import sqlite3
-from io import BytesIO
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from typing import Any, Callable, Dict, Iterator
 
+import orjson
 import requests
-from flask import Flask, Response, abort, jsonify, render_template_string, request, send_file, url_for
+from requests.adapters import HTTPAdapter
+from flask import (
+    Flask,
+    Response,
+    abort,
+    request,
+    send_from_directory,
+    stream_with_context,
+    url_for,
+)
+from flask_compress import Compress
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = Path(os.environ.get("BOT_DB_PATH", BASE_DIR / "bot.db"))
 BOT_TOKEN = os.environ.get("BOT_TOKEN")  # provide to fetch avatars from Telegram
 
+# The bot stores logged files on disk, with paths relative to the database directory.
+MESSAGE_FILES_ROOT = DB_PATH.resolve().parent
+
 app = Flask(__name__)
+# Compression is opt-in: only the page and the buffered users list use
+# @compress.compressed(). Streamed JSON goes out as it is produced, and file
+# routes keep their bytes, Range replies and bare ETags (flask-compress would
+# re-encode them and append ":gzip" to the ETag). COMPRESS_LEVEL is gzip's only.
+app.config.update(
+    COMPRESS_REGISTER=False,
+    COMPRESS_STREAMS=False,
+    COMPRESS_MIMETYPES=["application/json", "text/html"],
+    COMPRESS_LEVEL=5,
+    COMPRESS_MIN_SIZE=1024,
+)
+compress = Compress(app)
+
+# Set by the Werkzeug reloader in the child it spawns. Startup work below only
+# touches files on disk, so the parent (or gunicorn master/worker) doing it once is enough.
+RELOADER_CHILD = bool(os.environ.get("WERKZEUG_RUN_MAIN"))
+
+READ_POOL_SIZE = min(8, (os.cpu_count() or 1) * 2)
+
+# Keyset pagination: page sizes and the "no cursor yet" upper bound for ids.
+USERS_PAGE_SIZE = 50
+USERS_PAGE_MAX = 200
+MESSAGES_PAGE_SIZE = 100
+MESSAGES_PAGE_MAX = 1000
+MAX_ROWID = 2**63 - 1
+
+# Fixed statement text so every call hits the connection's prepared-statement cache.
+SQL_USERS_LIST = """
+    SELECT telegram_id, name, username, status, profile_photo_file_id,
+           created_at, updated_at, entry_count, last_message_at
+    FROM users
+    WHERE (COALESCE(last_message_at, ''), telegram_id) < (?, ?)
+    ORDER BY COALESCE(last_message_at, '') DESC, telegram_id DESC
+    LIMIT ?
+"""
+SQL_USER_BY_ID = "SELECT * FROM users WHERE telegram_id = ?"
+SQL_USER_MESSAGES = """
+    SELECT * FROM (
+        SELECT id, msg_type, content, file_id, file_mime,
+               (file_path IS NOT NULL OR file_data IS NOT NULL) AS has_file, chat_type, created_at
+        FROM user_messages
+        WHERE user_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ) ORDER BY id ASC
+"""
+SQL_USER_PAYMENTS = "SELECT * FROM payments WHERE user_id = ? ORDER BY created_at DESC"
+SQL_USER_EXCHANGES = "SELECT * FROM exchange_requests WHERE user_id = ? ORDER BY created_at DESC"
+SQL_MESSAGE_FILE_META = (
+    "SELECT length(file_data) AS size, file_path, file_mime FROM user_messages WHERE id = ?"
+)
+SQL_MESSAGE_FILE = "SELECT file_data FROM user_messages WHERE id = ?"
+
+# Names for the status codes the bot stores, indexed by code (UserStatus,
+# PayStatus and ExStatus in main.py). Databases the bot has not migrated yet
+# still hold the names themselves, which pass through unchanged.
+USER_STATUS_NAMES = ("pending", "needs_update", "approved", "rejected")
+PAYMENT_STATUS_NAMES = ("pending", "approved", "rejected")
+EXCHANGE_STATUS_NAMES = (
+    "pending_admin",
+    "awaiting_wallet",
+    "awaiting_transfer",
+    "awaiting_user_wallet",
+    "awaiting_payout",
+    "completed",
+    "rejected",
+    "expired",
+)
+
+
+def status_names(names: tuple[str, ...]) -> Callable[[sqlite3.Row], Dict[str, Any]]:
+    """Row converter that replaces an integer ``status`` with its name."""
+
+    def convert(row: sqlite3.Row) -> Dict[str, Any]:
+        data = dict(row)
+        code = data.get("status")
+        if isinstance(code, int) and 0 <= code < len(names):
+            data["status"] = names[code]
+        return data
+
+    return convert
+
+
+user_row_dict = status_names(USER_STATUS_NAMES)
+
+CONN_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-64000;",
+    "PRAGMA mmap_size=268435456;",
+)
 
 
 # ------------ data helpers ------------ #
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+def _open_conn(readonly: bool) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only=1;")
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+    for pragma in CONN_PRAGMAS:
+        conn.execute(pragma)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def row_to_dict(row: sqlite3.Row | None) -> Dict[str, Any] | None:
-    if row is None:
-        return None
-    return {k: row[k] for k in row.keys()}
+class ReadPool:
+    """Bounded pool of read-only connections shared by the worker threads.
+
+    Connections are opened on demand (so a missing DB does not break import)
+    until ``size`` exist; after that callers block until one is returned.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._idle: queue.Queue[sqlite3.Connection] = queue.Queue(maxsize=size)
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                conn = _open_conn(readonly=True)
+                self._opened += 1
+                return conn
+        return self._idle.get()
 
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
 
-def message_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
-    data = {k: row[k] for k in row.keys() if k != "file_data"}
-    data["has_file"] = row["file_data"] is not None
-    return data
+
+READ_POOL = ReadPool(READ_POOL_SIZE)
+_writer: sqlite3.Connection | None = None
+_writer_lock = threading.Lock()
+
+
+@contextmanager
+def get_conn(readonly: bool = True) -> Iterator[sqlite3.Connection]:
+    """Check out a pooled reader, or the single writer when ``readonly=False``."""
+    global _writer
+    if readonly:
+        with READ_POOL.connection() as conn:
+            yield conn
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = _open_conn(readonly=False)
+        with _writer:
+            yield _writer
+
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run consecutive SELECTs inside one read transaction (a single WAL snapshot)."""
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+def init_db() -> None:
+    """One-shot startup setup on the writer connection.
+
+    WAL mode is persisted in the database header, so every pooled reader
+    opened afterwards runs in WAL without repeating the PRAGMA.
+    """
+    if not DB_PATH.exists():
+        return
+    with get_conn(readonly=False) as conn:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        has_messages = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_messages'"
+        ).fetchone()
+        if has_messages:
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_user_messages_user_id "
+                "ON user_messages(user_id, id)"
+            )
+            ensure_message_file_path(conn)
+            ensure_last_message_at(conn)
+
+
+def ensure_message_file_path(conn: sqlite3.Connection) -> None:
+    """Add ``user_messages.file_path`` to databases the bot has not migrated yet.
+
+    The message queries select it next to ``file_data``; until the bot's own
+    migration moves BLOBs to disk it simply stays NULL. That migration only
+    adds columns that are missing, so adding it here first is safe.
+    """
+    cols = {row["name"] for row in conn.execute("PRAGMA table_info(user_messages)")}
+    if "file_path" not in cols:
+        conn.execute("ALTER TABLE user_messages ADD COLUMN file_path TEXT")
+
+
+def ensure_last_message_at(conn: sqlite3.Connection) -> None:
+    """Keep ``users.last_message_at`` denormalized so the sidebar sorts without a join.
+
+    The column is backfilled once when first added; after that the insert
+    trigger maintains it for every message the bot logs.
+    """
+    cols = {row["name"] for row in conn.execute("PRAGMA table_info(users)")}
+    if "last_message_at" not in cols:
+        conn.execute("ALTER TABLE users ADD COLUMN last_message_at TEXT")
+        conn.execute(
+            "UPDATE users SET last_message_at = "
+            "(SELECT MAX(created_at) FROM user_messages WHERE user_id = telegram_id)"
+        )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS tr_umsg_ai AFTER INSERT ON user_messages
+        BEGIN
+            UPDATE users SET last_message_at = NEW.created_at WHERE telegram_id = NEW.user_id;
+        END
+        """
+    )
+    # Same expression as SQL_USERS_LIST, so paging is an index range scan with
+    # users that never wrote anything ('' sorts lowest) at the end.
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_users_last_msg "
+        "ON users(COALESCE(last_message_at, ''), telegram_id)"
+    )
+
+
+if not RELOADER_CHILD:
+    init_db()
+
+
+def iter_json_rows(
+    cur: sqlite3.Cursor, convert: Callable[[sqlite3.Row], Dict[str, Any]] = dict, batch: int = 256
+) -> Iterator[bytes]:
+    """Yield the comma-separated JSON encoding of a cursor, ``batch`` rows at a time."""
+    sep = b""
+    while rows := cur.fetchmany(batch):
+        yield sep + b",".join(orjson.dumps(convert(r)) for r in rows)
+        sep = b","
+
+
+def json_response(obj: Any) -> Response:
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), mimetype="application/json")
+
+
+def bytes_response(data: bytes, mimetype: str) -> Response:
+    """Send an in-memory payload as-is, without copying it into a file object."""
+    return Response(
+        data,
+        mimetype=mimetype,
+        headers={"Content-Length": str(len(data))},
+        direct_passthrough=True,
+    )
 
 
 # ------------ API routes ------------ #
+def users_cursor(row: sqlite3.Row) -> str:
+    return f"{row['last_message_at'] or ''}|{row['telegram_id']}"
+
+
 @app.route("/api/users")
+@compress.compressed()
 def api_users() -> Response:
+    limit = int_arg("limit", USERS_PAGE_SIZE, USERS_PAGE_MAX)
+    cursor = request.args.get("cursor")
+    if cursor:
+        cursor_key, _, cursor_id = cursor.rpartition("|")
+        if not cursor_id.isdigit():
+            abort(400)
+        after = (cursor_key, int(cursor_id))
+    else:
+        after = ("9999", MAX_ROWID)
     with get_conn() as conn:
-        cur = conn.execute(
-            """
-            SELECT telegram_id, name, username, bio, status, profile_photo_file_id,
-                   created_at, updated_at, entry_count
-            FROM users
-            ORDER BY COALESCE(updated_at, created_at) DESC
-            """
-        )
-        rows = [row_to_dict(r) for r in cur.fetchall()]
-    return jsonify({"users": rows, "db_path": str(DB_PATH)})
+        rows = conn.execute(SQL_USERS_LIST, (*after, limit)).fetchall()
+    next_cursor = users_cursor(rows[-1]) if len(rows) == limit else None
+    users = list(map(user_row_dict, rows))
+    for u in users:
+        u["avatar_url"] = avatar_src(u["profile_photo_file_id"])
+    return json_response({"users": users, "next_cursor": next_cursor, "db_path": str(DB_PATH)})
+
+
+def iter_message_page(
+    conn: sqlite3.Connection, telegram_id: int, before: int, limit: int
+) -> Iterator[bytes]:
+    """Yield ``"messages":[...],"next_before":<id|null>`` for one page, oldest first.
+
+    Pages walk backwards by id from ``before``; ``next_before`` is the oldest id
+    on a full page, to be passed as ``before`` for the next (older) page.
+    """
+    page = {"count": 0, "oldest": None}
+
+    def convert(row: sqlite3.Row) -> Dict[str, Any]:
+        if page["oldest"] is None:
+            page["oldest"] = row["id"]
+        page["count"] += 1
+        return dict(row)
+
+    cur = conn.execute(SQL_USER_MESSAGES, (telegram_id, before, limit))
+    yield b'"messages":['
+    yield from iter_json_rows(cur, convert)
+    next_before = page["oldest"] if page["count"] == limit else None
+    yield b'],"next_before":' + orjson.dumps(next_before)
+
+
+def int_arg(name: str, default: int, maximum: int) -> int:
+    """Read a positive integer query arg, falling back to ``default`` when malformed."""
+    try:
+        value = int(request.args.get(name, default))
+    except ValueError:
+        return default
+    return min(max(value, 1), maximum)
+
+
+def message_page_args() -> tuple[int, int]:
+    limit = int_arg("limit", MESSAGES_PAGE_SIZE, MESSAGES_PAGE_MAX)
+    before = int_arg("before", MAX_ROWID, MAX_ROWID)
+    return before, limit
 
 
 @app.route("/api/user/<int:telegram_id>")
 def api_user(telegram_id: int) -> Response:
-    limit = min(int(request.args.get("limit", 400)), 1000)
-    with get_conn() as conn:
-        user_row = conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,)).fetchone()
-        if not user_row:
-            abort(404)
-        messages = conn.execute(
-            """
-            SELECT id, msg_type, content, file_id, file_mime, file_data, chat_type, created_at
-            FROM user_messages
-            WHERE user_id = ?
-            ORDER BY datetime(created_at) ASC
-            LIMIT ?
-            """,
-            (telegram_id, limit),
-        ).fetchall()
-        payments = conn.execute(
-            "SELECT * FROM payments WHERE user_id = ? ORDER BY created_at DESC", (telegram_id,)
-        ).fetchall()
-        exchanges = conn.execute(
-            "SELECT * FROM exchange_requests WHERE user_id = ? ORDER BY created_at DESC",
-            (telegram_id,),
-        ).fetchall()
-    return jsonify(
-        {
-            "user": row_to_dict(user_row),
-            "messages": [message_to_dict(m) for m in messages],
-            "payments": [row_to_dict(p) for p in payments],
-            "exchanges": [row_to_dict(e) for e in exchanges],
-        }
-    )
+    before, limit = message_page_args()
+    # The user row and everything streamed after it come from one snapshot. The
+    # connection stays checked out until the response is closed, which also
+    # covers a client that disconnects before the body is read.
+    snapshot = ExitStack()
+    try:
+        conn = snapshot.enter_context(get_conn())
+        snapshot.enter_context(read_snapshot(conn))
+        user_row = conn.execute(SQL_USER_BY_ID, (telegram_id,)).fetchone()
+    except BaseException:
+        snapshot.close()
+        raise
+    if not user_row:
+        snapshot.close()
+        abort(404)
+
+    def generate() -> Iterator[bytes]:
+        yield b'{"user":' + orjson.dumps(user_row_dict(user_row)) + b","
+        yield from iter_message_page(conn, telegram_id, before, limit)
+        yield b',"payments":['
+        yield from iter_json_rows(
+            conn.execute(SQL_USER_PAYMENTS, (telegram_id,)), status_names(PAYMENT_STATUS_NAMES)
+        )
+        yield b'],"exchanges":['
+        yield from iter_json_rows(
+            conn.execute(SQL_USER_EXCHANGES, (telegram_id,)), status_names(EXCHANGE_STATUS_NAMES)
+        )
+        yield b"]}"
+
+    resp = Response(stream_with_context(generate()), mimetype="application/json")
+    resp.call_on_close(snapshot.close)
+    return resp
+
 
+@app.route("/api/user/<int:telegram_id>/messages")
+def api_user_messages(telegram_id: int) -> Response:
+    before, limit = message_page_args()
 
-def placeholder_avatar(text: str = "NA") -> Response:
+    def generate() -> Iterator[bytes]:
+        with get_conn() as conn:
+            yield b"{"
+            yield from iter_message_page(conn, telegram_id, before, limit)
+            yield b"}"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+
+def data_url(content: bytes, mimetype: str) -> str:
+    return f"data:{mimetype};base64,{base64.b64encode(content).decode()}"
+
+
+def placeholder_svg(initials: str) -> str:
     # Simple SVG circle avatar with initials
-    initials = (text or "NA").strip() or "NA"
-    initials = initials[:2].upper()
-    svg = f"""
+    return f"""
     <svg xmlns="http://www.w3.org/2000/svg" width="96" height="96">
       <defs>
         <linearGradient id="g" x1="0" x2="1" y1="0" y2="1">
@@ -115,75 +439,258 @@ def placeholder_avatar(text: str = "NA") -> Response:
       <text x="50%" y="55%" font-family="Segoe UI, Arial" font-size="32" fill="#fff" text-anchor="middle">{initials}</text>
     </svg>
     """
-    return Response(svg, mimetype="image/svg+xml")
+
+
+PLACEHOLDER_SVG = placeholder_svg("NA").encode()
+PLACEHOLDER_DATA_URL = data_url(PLACEHOLDER_SVG, "image/svg+xml")
+# Short, since the same /avatar URL should pick up the real photo once Telegram serves it.
+PLACEHOLDER_MAX_AGE = 300
+
+
+def placeholder_avatar() -> Response:
+    resp = bytes_response(PLACEHOLDER_SVG, "image/svg+xml")
+    resp.cache_control.public = True
+    resp.cache_control.max_age = PLACEHOLDER_MAX_AGE
+    return resp
+
+
+class FileCache:
+    """Thread-safe LRU of Telegram file payloads, bounded by total bytes.
+
+    Telegram file_ids are immutable, so entries never need invalidating.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_id: str) -> tuple[bytes, str] | None:
+        with self._lock:
+            item = self._items.get(file_id)
+            if item is not None:
+                self._items.move_to_end(file_id)
+            return item
+
+    def put(self, file_id: str, item: tuple[bytes, str]) -> None:
+        size = len(item[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(file_id, None)
+            if old is not None:
+                self._size -= len(old[0])
+            self._items[file_id] = item
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+FILE_CACHE = FileCache(max_bytes=64 * 1024 * 1024)
+FILE_CACHE_MAX_AGE = 86400
+FILE_CHUNK_SIZE = 64 * 1024
+BLOB_CACHE_MAX_AGE = 3600
+
+# Keep-alive session so getFile + download reuse one TLS connection to api.telegram.org.
+TG_SESSION = requests.Session()
+TG_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64))
+
+
+def _get_file_path(file_id: str) -> str | None:
+    meta = TG_SESSION.get(
+        f"https://api.telegram.org/bot{BOT_TOKEN}/getFile",
+        params={"file_id": file_id},
+        timeout=10,
+    )
+    meta.raise_for_status()
+    return meta.json().get("result", {}).get("file_path")
+
+
+def _stream_file(file_path: str) -> requests.Response:
+    """Open the download for a Telegram file_path without reading the body yet."""
+    file_res = TG_SESSION.get(
+        f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}",
+        timeout=15,
+        stream=True,
+    )
+    file_res.raise_for_status()
+    return file_res
+
+
+def _read_body(file_res: requests.Response) -> bytes:
+    """Read a streamed body straight into one buffer sized from Content-Length.
+
+    ``Response.content`` collects chunks and joins them, which briefly holds
+    the file twice; that remains the fallback for bodies of unknown size.
+    """
+    length = file_res.headers.get("Content-Length", "")
+    if not length.isdigit() or file_res.headers.get("Content-Encoding"):
+        return file_res.content
+    buf = bytearray(int(length))
+    view = memoryview(buf)
+    size = 0
+    with file_res:
+        while size < len(buf):
+            read = file_res.raw.readinto(view[size:])
+            if not read:
+                break
+            size += read
+    view.release()
+    if size < len(buf):
+        del buf[size:]
+    return buf
+
+
+def _download_telegram_file(file_id: str) -> tuple[bytes, str] | None:
+    file_path = _get_file_path(file_id)
+    if not file_path:
+        return None
+    file_res = _stream_file(file_path)
+    mimetype = file_res.headers.get("Content-Type", "application/octet-stream")
+    return _read_body(file_res), mimetype
 
 
 def fetch_telegram_file(file_id: str) -> tuple[bytes, str] | None:
-    """Return (content, mimetype) for a Telegram file_id, or None on failure."""
+    """Return (content, mimetype) for a Telegram file_id, or None on failure.
+
+    Successful downloads are memoized in FILE_CACHE; failures are not, so a
+    transient network error is retried on the next request.
+    """
     if not BOT_TOKEN or not file_id:
         return None
+    cached = FILE_CACHE.get(file_id)
+    if cached is not None:
+        return cached
     try:
-        meta = requests.get(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/getFile",
-            params={"file_id": file_id},
-            timeout=10,
-        )
-        meta.raise_for_status()
-        file_path = meta.json().get("result", {}).get("file_path")
-        if not file_path:
-            return None
-        file_res = requests.get(
-            f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}",
-            timeout=15,
-        )
-        file_res.raise_for_status()
-        mimetype = file_res.headers.get("Content-Type", "application/octet-stream")
-        return file_res.content, mimetype
+        fetched = _download_telegram_file(file_id)
     except Exception:
         return None
+    if fetched:
+        FILE_CACHE.put(file_id, fetched)
+    return fetched
+
+
+def file_etag(file_id: str) -> str:
+    return hashlib.sha1(file_id.encode()).hexdigest()
+
+
+def with_file_cache_headers(resp: Response, file_id: str) -> Response:
+    resp.set_etag(file_etag(file_id))
+    resp.cache_control.public = True
+    resp.cache_control.max_age = FILE_CACHE_MAX_AGE
+    return resp
+
+
+def telegram_file_response(file_id: str, content: bytes, mimetype: str) -> Response:
+    return with_file_cache_headers(bytes_response(content, mimetype), file_id)
+
+
+def iter_upstream(file_res: requests.Response) -> Iterator[bytes]:
+    try:
+        yield from file_res.iter_content(chunk_size=FILE_CHUNK_SIZE)
+    finally:
+        file_res.close()
 
 
 @app.route("/avatar/<path:file_id>")
 def avatar(file_id: str) -> Response:
+    if file_etag(file_id) in request.if_none_match:
+        return Response(status=304)
     fetched = fetch_telegram_file(file_id)
     if not fetched:
         return placeholder_avatar()
     content, mimetype = fetched
-    return send_file(BytesIO(content), mimetype=mimetype)
+    return telegram_file_response(file_id, content, mimetype)
+
+
+def avatar_src(file_id: str | None) -> str:
+    """Inline an avatar that is already in FILE_CACHE, else point at /avatar.
+
+    The users list never waits on Telegram; a miss is fetched by the browser's
+    /avatar request, which fills the cache for the next list load.
+    """
+    if not file_id:
+        return PLACEHOLDER_DATA_URL
+    cached = FILE_CACHE.get(file_id)
+    if cached is not None:
+        return data_url(*cached)
+    return url_for("avatar", file_id=file_id)
 
 
 @app.route("/file/<path:file_id>")
 def file_proxy(file_id: str) -> Response:
-    fetched = fetch_telegram_file(file_id)
-    if not fetched:
+    """Relay a Telegram file in FILE_CHUNK_SIZE pieces instead of buffering it."""
+    if file_etag(file_id) in request.if_none_match:
+        return Response(status=304)
+    cached = FILE_CACHE.get(file_id)
+    if cached is not None:
+        return telegram_file_response(file_id, *cached)
+    if not BOT_TOKEN:
         abort(404)
-    content, mimetype = fetched
-    return send_file(BytesIO(content), mimetype=mimetype)
+    try:
+        file_path = _get_file_path(file_id)
+        file_res = _stream_file(file_path) if file_path else None
+    except Exception:
+        file_res = None
+    if file_res is None:
+        abort(404)
+    headers = {}
+    if file_res.headers.get("Content-Length"):
+        headers["Content-Length"] = file_res.headers["Content-Length"]
+    resp = Response(
+        iter_upstream(file_res),
+        mimetype=file_res.headers.get("Content-Type", "application/octet-stream"),
+        headers=headers,
+        direct_passthrough=True,
+    )
+    return with_file_cache_headers(resp, file_id)
+
+
+def message_file_response(file_path: str, mimetype: str | None) -> Response:
+    # send_from_directory rejects paths escaping the root and answers
+    # If-None-Match / Range itself from the file's mtime and size.
+    resp = send_from_directory(
+        MESSAGE_FILES_ROOT,
+        file_path,
+        mimetype=mimetype or None,
+        max_age=BLOB_CACHE_MAX_AGE,
+    )
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    return resp
 
 
 @app.route("/file_blob/<int:msg_id>")
 def file_blob(msg_id: int) -> Response:
+    # Logged blobs never change, so (id, size) is enough for a validator and a
+    # revalidation never has to read the BLOB itself.
     with get_conn() as conn:
-        row = conn.execute(
-            "SELECT file_data, file_mime FROM user_messages WHERE id = ?",
-            (msg_id,),
-        ).fetchone()
-    if not row or row["file_data"] is None:
-        abort(404)
-    mime = row["file_mime"] or "application/octet-stream"
-    return send_file(BytesIO(row["file_data"]), mimetype=mime)
+        meta = conn.execute(SQL_MESSAGE_FILE_META, (msg_id,)).fetchone()
+        if meta and meta["file_path"]:
+            return message_file_response(meta["file_path"], meta["file_mime"])
+        if not meta or meta["size"] is None:
+            abort(404)
+        etag = f"{msg_id}-{meta['size']}"
+        if etag in request.if_none_match:
+            return Response(status=304)
+        row = conn.execute(SQL_MESSAGE_FILE, (msg_id,)).fetchone()
+    mime = meta["file_mime"] or "application/octet-stream"
+    resp = bytes_response(row["file_data"], mime)
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.max_age = BLOB_CACHE_MAX_AGE
+    return resp
 
 
 # ------------ UI route ------------ #
 @app.route("/")
+@compress.compressed()
 def home() -> str:
     if not DB_PATH.exists():
         return f"<h2>Database not found at {DB_PATH}</h2>"
-    return render_template_string(
-        TEMPLATE,
-        db_path=str(DB_PATH),
-        has_token=bool(BOT_TOKEN),
-    )
+    return RENDERED_HTML
 
 
 # ------------ HTML/JS template ------------ #
@@ -300,6 +807,10 @@ TEMPLATE = """
     .msg-photo { max-width: 260px; border-radius: 10px; margin-top: 6px; box-shadow: 0 6px 18px rgba(0,0,0,0.08); }
     .section-title { font-weight: 600; margin: 14px 0 6px; color: #1b3b68; }
     .empty { color: var(--muted); }
+    .load-older {
+      align-self: center; background: #f1f6ff; border: 1px solid #d9e7ff; color: #0f4f9c;
+      padding: 4px 12px; border-radius: 999px; font-size: 12px; cursor: pointer;
+    }
     @media (max-width: 960px) {
       body { flex-direction: column; }
       .sidebar { width: 100%; height: 40vh; }
@@ -361,6 +872,11 @@ TEMPLATE = """
     const pAvatar = document.getElementById('profileAvatar');
 
     let currentUserId = null;
+    const avatarUrls = {};
+    const USERS_PAGE = 50;
+    let nextUsersCursor = null;
+    let loadingUsers = false;
+    let nextMessagesBefore = null;
 
     function fmt(ts) {
       if (!ts) return '';
@@ -370,24 +886,32 @@ TEMPLATE = """
       const card = document.createElement('div');
       card.className = 'user-card';
       card.dataset.id = u.telegram_id;
-      const avatarSrc = `/avatar/${encodeURIComponent(u.profile_photo_file_id || 'none')}`;
+      avatarUrls[u.telegram_id] = u.avatar_url;
       card.innerHTML = `
-        <img class="avatar" src="${avatarSrc}" alt="avatar" onerror="this.src='data:image/svg+xml,';"/>
+        <img class="avatar" src="${u.avatar_url}" alt="avatar" onerror="this.src='data:image/svg+xml,';"/>
         <div class="meta">
           <div class="name">${u.name || 'No name'} <span class="pill">${u.status || ''}</span></div>
           <div class="username">${u.username || ''}</div>
-          <div class="username">Updated: ${fmt(u.updated_at) || fmt(u.created_at) || ''}</div>
+          <div class="username">Last message: ${fmt(u.last_message_at) || '—'}</div>
         </div>
       `;
       card.onclick = () => loadUser(u.telegram_id, card);
       return card;
     }
 
-    async function loadUsers() {
-      const res = await fetch('/api/users');
+    async function loadUsers(cursor) {
+      if (loadingUsers) return;
+      loadingUsers = true;
+      const params = new URLSearchParams({ limit: USERS_PAGE });
+      if (cursor) params.set('cursor', cursor);
+      const res = await fetch('/api/users?' + params);
       const data = await res.json();
-      userList.innerHTML = '';
+      if (!cursor) userList.innerHTML = '';
       data.users.forEach(u => userList.appendChild(createUserCard(u)));
+      nextUsersCursor = data.next_cursor;
+      loadingUsers = false;
+      // Keep paging until the list can scroll, otherwise the scroll handler never fires.
+      if (nextUsersCursor && userList.scrollHeight <= userList.clientHeight) loadUsers(nextUsersCursor);
     }
 
     async function loadUser(id, cardEl) {
@@ -425,7 +949,7 @@ TEMPLATE = """
       pId.textContent = u.id_number || '—';
       pBio.textContent = u.bio || '—';
       pCreated.textContent = fmt(u.created_at);
-      pAvatar.src = '/avatar/' + encodeURIComponent(u.profile_photo_file_id || 'none');
+      pAvatar.src = avatarUrls[u.telegram_id] || '/avatar/' + encodeURIComponent(u.profile_photo_file_id || 'none');
       pAvatar.onerror = () => { pAvatar.src = 'data:image/svg+xml,'; };
       profileCard.style.display = 'grid';
 
@@ -435,52 +959,94 @@ TEMPLATE = """
       if (!msgs.length) {
         messagesEl.innerHTML = '<div class="empty">No messages logged.</div>';
       } else {
-        msgs.forEach(m => {
-          const b = document.createElement('div');
-          const sender =
-            (m.msg_type || '').toLowerCase().includes('bot') ||
-            (m.chat_type || '').toLowerCase().includes('bot')
-              ? 'bot'
-              : 'user';
-          b.className = 'bubble ' + sender;
-          const isPhoto = (m.file_mime || '').startsWith('image') || (m.msg_type || '').toLowerCase().includes('photo');
-          let body = escapeHtml(m.content || '');
-          if (m.has_file) {
-            const url = `/file_blob/${m.id}`;
-            if (isPhoto) {
-              body += `<div><img class="msg-photo" src="${url}" onerror="this.style.display='none'"></div>`;
-            } else {
-              body += `<div><a href="${url}" target="_blank">Download file</a></div>`;
-            }
-          } else if (m.file_id) {
-            const url = `/file/${encodeURIComponent(m.file_id)}`;
-            if (isPhoto) {
-              body += `<div><img class="msg-photo" src="${url}" onerror="this.style.display='none'"></div>`;
-            } else {
-              body += `<div><a href="${url}" target="_blank">Download file</a></div>`;
-            }
-          }
-          b.innerHTML = `${body}<span class="ts">${fmt(m.created_at)}</span>`;
-          messagesEl.appendChild(b);
-        });
+        msgs.forEach(m => messagesEl.appendChild(renderMessage(m)));
+        setOlderButton(data.next_before);
         messagesEl.scrollTop = messagesEl.scrollHeight;
       }
     }
 
+    function renderMessage(m) {
+      const b = document.createElement('div');
+      const sender =
+        (m.msg_type || '').toLowerCase().includes('bot') ||
+        (m.chat_type || '').toLowerCase().includes('bot')
+          ? 'bot'
+          : 'user';
+      b.className = 'bubble ' + sender;
+      const isPhoto = (m.file_mime || '').startsWith('image') || (m.msg_type || '').toLowerCase().includes('photo');
+      let body = escapeHtml(m.content || '');
+      if (m.has_file) {
+        const url = `/file_blob/${m.id}`;
+        if (isPhoto) {
+          body += `<div><img class="msg-photo" src="${url}" onerror="this.style.display='none'"></div>`;
+        } else {
+          body += `<div><a href="${url}" target="_blank">Download file</a></div>`;
+        }
+      } else if (m.file_id) {
+        const url = `/file/${encodeURIComponent(m.file_id)}`;
+        if (isPhoto) {
+          body += `<div><img class="msg-photo" src="${url}" onerror="this.style.display='none'"></div>`;
+        } else {
+          body += `<div><a href="${url}" target="_blank">Download file</a></div>`;
+        }
+      }
+      b.innerHTML = `${body}<span class="ts">${fmt(m.created_at)}</span>`;
+      return b;
+    }
+
+    function setOlderButton(before) {
+      nextMessagesBefore = before;
+      const existing = document.getElementById('loadOlder');
+      if (existing) existing.remove();
+      if (!before) return;
+      const btn = document.createElement('button');
+      btn.id = 'loadOlder';
+      btn.className = 'load-older';
+      btn.textContent = 'Load older messages';
+      btn.onclick = loadOlderMessages;
+      messagesEl.prepend(btn);
+    }
+
+    async function loadOlderMessages() {
+      const id = currentUserId;
+      const res = await fetch(`/api/user/${id}/messages?before=${nextMessagesBefore}`);
+      if (!res.ok || id !== currentUserId) return;
+      const data = await res.json();
+      const prevHeight = messagesEl.scrollHeight;
+      const frag = document.createDocumentFragment();
+      (data.messages || []).forEach(m => frag.appendChild(renderMessage(m)));
+      const btn = document.getElementById('loadOlder');
+      if (btn) btn.after(frag); else messagesEl.prepend(frag);
+      setOlderButton(data.next_before);
+      messagesEl.scrollTop += messagesEl.scrollHeight - prevHeight;
+    }
+
     function escapeHtml(str) {
       return (str || '').replace(/[&<>"']/g, s => ({
         '&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'
       }[s]));
     }
 
+    userList.addEventListener('scroll', () => {
+      if (nextUsersCursor && userList.scrollTop + userList.clientHeight >= userList.scrollHeight - 200) {
+        loadUsers(nextUsersCursor);
+      }
+    });
+
     loadUsers();
   </script>
 </body>
 </html>
 """
 
+# db_path and has_token are fixed for the process lifetime, so render once.
+RENDERED_HTML = app.jinja_env.from_string(TEMPLATE).render(
+    db_path=str(DB_PATH),
+    has_token=bool(BOT_TOKEN),
+)
+
 
 if __name__ == "__main__":
     if not DB_PATH.exists():
         raise SystemExit(f"Database file not found at {DB_PATH}")
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    app.run(host="0.0.0.0", port=5000, threaded=True, debug=os.environ.get("DEBUG") == "1")
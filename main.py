@@ -2,11 +2,21 @@ import asyncio
 import logging
 import mimetypes
 import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext, suppress
 from dataclasses import dataclass
+from enum import IntEnum
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
 from datetime import datetime, UTC, timedelta
-from typing import Optional, Tuple
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import aiosqlite
+from aiolimiter import AsyncLimiter
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.error import BadRequest
 from telegram.ext import (
@@ -21,6 +31,11 @@ from telegram.ext import (
     filters,
 )
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
+
 # Conversation states
 SELECT, NAME, ID_CARD_PHOTO, ID_NUMBER, SELFIE_WITH_ID, EMAIL, EX_HASH, EX_SCREEN = range(8)
 
@@ -49,159 +64,548 @@ class Config:
     port: int
 
 
-async def init_db(db_path: str = "bot.db") -> aiosqlite.Connection:
-    conn = await aiosqlite.connect(db_path)
-    await conn.execute(
+# Status columns hold these codes. The lowercase member names are the strings
+# older databases stored, and what users and admins are shown.
+class UserStatus(IntEnum):
+    PENDING = 0
+    NEEDS_UPDATE = 1
+    APPROVED = 2
+    REJECTED = 3
+
+
+class PayStatus(IntEnum):
+    PENDING = 0
+    APPROVED = 1
+    REJECTED = 2
+
+
+class ExStatus(IntEnum):
+    # Open states come first, so "still open" is status < COMPLETED.
+    PENDING_ADMIN = 0
+    AWAITING_WALLET = 1
+    AWAITING_TRANSFER = 2
+    AWAITING_USER_WALLET = 3
+    AWAITING_PAYOUT = 4
+    COMPLETED = 5
+    REJECTED = 6
+    EXPIRED = 7
+
+
+# Connection tuning applied before the schema is created. WAL + NORMAL drops the
+# per-commit fsyncs that dominate the small inserts this bot does.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA cache_size=-64000;",
+    "PRAGMA mmap_size=268435456;",
+    "PRAGMA busy_timeout=5000;",
+)
+
+
+# Reader connections opened next to the single writer.
+DB_READERS = 4
+
+# All writes go through one queue and are committed in groups. Awaited writes
+# wait at most WRITE_COALESCE_WINDOW for company; a batch holding only
+# fire-and-forget log rows waits up to LOG_FLUSH_INTERVAL.
+WRITE_BATCH_SIZE = 100
+WRITE_COALESCE_WINDOW = 0.005
+LOG_FLUSH_INTERVAL = 0.1
+
+# Logged files live on disk next to the database; user_messages keeps the
+# path relative to the database directory.
+MESSAGE_FILES_DIR = "files"
+
+SQL_INSERT_USER_MESSAGE = """
+    INSERT INTO user_messages (user_id, msg_type, content, file_id, file_path, file_mime, chat_type, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_ATTACH_MESSAGE_FILE = """
+    UPDATE user_messages SET file_path = ?, file_mime = ?
+    WHERE file_id = ? AND file_path IS NULL
+"""
+
+# get_user_state answers from memory for this long; every write to a users row
+# drops its entry once committed, so the TTL only bounds changes from other processes.
+USER_STATE_TTL = 30.0
+USER_STATE_CACHE_MAX = 4096
+
+# (sql, params, future); the future is None for writes nobody waits on.
+QueuedWrite = Tuple[str, Tuple[Any, ...], Optional[asyncio.Future]]
+
+
+class DBPool:
+    """One writer connection plus a queue of read-only reader connections.
+
+    In WAL mode readers do not block the writer (or each other), so lookups
+    from concurrent updates no longer wait behind inserts. Writes are queued
+    to a single task that commits them in groups, one fsync per group.
+    ``execute`` and ``commit`` proxy to the writer for scripts that issue
+    their own SQL outside the bot; the writer runs in autocommit mode, so each
+    such statement is its own transaction and ``commit`` has nothing to do.
+    """
+
+    def __init__(
+        self, writer: aiosqlite.Connection, readers: List[aiosqlite.Connection], files_root: Path
+    ) -> None:
+        self.writer = writer
+        self.files_root = files_root
+        self._readers = readers
+        self.readers: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for reader in readers:
+            self.readers.put_nowait(reader)
+        self.write_lock = asyncio.Lock()
+        # Written in order; None is the shutdown sentinel.
+        self.write_queue: asyncio.Queue[Optional[QueuedWrite]] = asyncio.Queue()
+        self._write_task = asyncio.create_task(self._write_loop())
+        # telegram_id -> (fetched at, state row); see get_user_state.
+        self.user_states: Dict[int, Tuple[float, Optional[aiosqlite.Row]]] = {}
+        self.user_states_epoch = 0
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        conn = await self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put_nowait(conn)
+
+    async def fetchone(self, sql: str, params: Iterable[Any] = ()) -> Optional[aiosqlite.Row]:
+        async with self.reader() as conn:
+            cursor = await conn.execute(sql, params)
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: Iterable[Any] = ()) -> List[aiosqlite.Row]:
+        async with self.reader() as conn:
+            cursor = await conn.execute(sql, params)
+            return list(await cursor.fetchall())
+
+    def queue_write(self, sql: str, params: Tuple[Any, ...]) -> None:
+        """Write with the next group commit without waiting for it."""
+        self.write_queue.put_nowait((sql, params, None))
+
+    async def execute_write(self, sql: str, params: Tuple[Any, ...] = ()) -> int:
+        """Write with the next group commit; returns the statement's lastrowid once committed."""
+        future = asyncio.get_running_loop().create_future()
+        self.write_queue.put_nowait((sql, params, future))
+        return await future
+
+    async def execute(self, sql: str, params: Iterable[Any] = ()) -> aiosqlite.Cursor:
+        return await self.writer.execute(sql, params)
+
+    async def commit(self) -> None:
+        await self.writer.commit()
+
+    async def _write_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.write_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            window = WRITE_COALESCE_WINDOW if item[2] else LOG_FLUSH_INTERVAL
+            deadline = loop.time() + window
+            stopping = False
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.write_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if item[2]:
+                    deadline = min(deadline, loop.time() + WRITE_COALESCE_WINDOW)
+            await self._commit_batch(batch)
+            if stopping:
+                return
+
+    async def _commit_batch(self, batch: List[QueuedWrite]) -> None:
+        results: List[Tuple[asyncio.Future, Any]] = []
+        try:
+            async with self.write_lock:
+                await self.writer.execute("BEGIN IMMEDIATE;")
+                # Runs of unawaited rows for the same statement go in one executemany.
+                for (sql, awaited), items in groupby(batch, key=lambda w: (w[0], w[2] is not None)):
+                    items = list(items)
+                    if not awaited:
+                        await self._write_rows(sql, [params for _, params, _ in items])
+                        continue
+                    for _, params, future in items:
+                        try:
+                            cursor = await self.writer.execute(sql, params)
+                        except sqlite3.Error as exc:
+                            results.append((future, exc))
+                        else:
+                            results.append((future, cursor.lastrowid))
+                await self.writer.execute("COMMIT;")
+        except Exception as exc:
+            logger.error("Failed to commit %d queued writes: %s", len(batch), exc)
+            for _, _, future in batch:
+                if future and not future.done():
+                    future.set_exception(exc)
+            # Autocommit leaves a failed BEGIN ... COMMIT open; the next batch needs a clean start.
+            with suppress(sqlite3.Error):
+                if self.writer.in_transaction:
+                    await self.writer.execute("ROLLBACK;")
+            return
+        for future, result in results:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _write_rows(self, sql: str, rows: List[Tuple[Any, ...]]) -> None:
+        """executemany unawaited rows; if one is bad, redo them singly and drop only that one.
+
+        The savepoint undoes the rows executemany applied before the failure,
+        so the row-by-row retry does not insert them twice.
         """
-        CREATE TABLE IF NOT EXISTS users (
-            telegram_id INTEGER PRIMARY KEY,
-            name TEXT,
-            id_number TEXT,
-            id_card_file_id TEXT,
-            selfie_with_id_file_id TEXT,
-            email TEXT,
-            status TEXT DEFAULT 'pending',
-            attempts INTEGER DEFAULT 1,
-            entry_count INTEGER DEFAULT 0,
-            username TEXT,
-            bio TEXT,
-            profile_photo_file_id TEXT,
-            created_at TEXT,
-            updated_at TEXT
+        await self.writer.execute("SAVEPOINT queued_rows;")
+        try:
+            await self.writer.executemany(sql, rows)
+        except sqlite3.Error:
+            await self.writer.execute("ROLLBACK TO queued_rows;")
+            for params in rows:
+                try:
+                    await self.writer.execute(sql, params)
+                except sqlite3.Error as exc:
+                    logger.error("Dropped a queued row: %s", exc)
+        await self.writer.execute("RELEASE queued_rows;")
+
+    async def close(self) -> None:
+        self.write_queue.put_nowait(None)
+        await self._write_task
+        # Writes queued behind the sentinel still get committed.
+        pending = [item for item in iter_queue(self.write_queue) if item is not None]
+        if pending:
+            await self._commit_batch(pending)
+        for reader in self._readers:
+            await reader.close()
+        await self.writer.close()
+
+
+def iter_queue(q: "asyncio.Queue[Optional[QueuedWrite]]") -> Iterator[Optional[QueuedWrite]]:
+    while not q.empty():
+        yield q.get_nowait()
+
+
+async def open_reader(db_path: str) -> aiosqlite.Connection:
+    conn = await aiosqlite.connect(db_path, isolation_level=None)
+    conn.row_factory = aiosqlite.Row
+    # journal_mode is persisted by the writer; the rest is per connection.
+    for pragma in SQLITE_PRAGMAS[2:]:
+        await conn.execute(pragma)
+    await conn.execute("PRAGMA query_only=1;")
+    return conn
+
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    telegram_id INTEGER PRIMARY KEY,
+    name TEXT,
+    id_number TEXT,
+    id_card_file_id TEXT,
+    selfie_with_id_file_id TEXT,
+    email TEXT,
+    status INTEGER DEFAULT 0,  -- UserStatus.PENDING
+    attempts INTEGER DEFAULT 1,
+    entry_count INTEGER DEFAULT 0,
+    username TEXT,
+    bio TEXT,
+    profile_photo_file_id TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    tx_hash TEXT,
+    screenshot_file_id TEXT,
+    status INTEGER DEFAULT 0,  -- PayStatus.PENDING
+    created_at TEXT,
+    FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+);
+CREATE TABLE IF NOT EXISTS exchange_requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    tx_hash TEXT,
+    screenshot_file_id TEXT,
+    status INTEGER DEFAULT 0,  -- ExStatus.PENDING_ADMIN
+    approved_at TEXT,
+    expires_at TEXT,
+    payout_tx_hash TEXT,
+    payout_screenshot_file_id TEXT,
+    completed_at TEXT,
+    wallet_address TEXT,
+    user_wallet_address TEXT,
+    created_at TEXT,
+    FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+);
+CREATE TABLE IF NOT EXISTS user_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    msg_type TEXT,
+    content TEXT,
+    file_id TEXT,
+    file_data BLOB,
+    file_path TEXT,
+    file_mime TEXT,
+    chat_type TEXT,
+    created_at TEXT,
+    FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+);
+CREATE TABLE IF NOT EXISTS schema_meta (version INTEGER);
+"""
+
+
+async def init_db(db_path: str = "bot.db", readers: int = DB_READERS) -> DBPool:
+    # Autocommit: sqlite3 never opens a transaction on its own, so the only
+    # BEGIN/COMMIT pairs are the explicit ones in the write loop and migration.
+    conn = await aiosqlite.connect(db_path, isolation_level=None)
+    for pragma in SQLITE_PRAGMAS:
+        await conn.execute(pragma)
+    await conn.executescript(SCHEMA_SQL)
+    # Ensure new columns exist if table was created previously
+    files_root = Path(db_path).resolve().parent
+    await ensure_user_columns(conn, files_root)
+    # After the migration, since older databases gain completed_at there.
+    await conn.executescript("\n".join(SCHEMA_INDEXES))
+    conn.row_factory = aiosqlite.Row
+    return DBPool(conn, [await open_reader(db_path) for _ in range(readers)], files_root)
+
+
+SCHEMA_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_ex_user_status_completed "
+    "ON exchange_requests(user_id, status, completed_at DESC);",
+    "CREATE INDEX IF NOT EXISTS idx_pay_user ON payments(user_id);",
+    # Partial: only open exchanges, so "does this user have one open?" is a
+    # single seek (status only makes it covering). Queries must repeat the
+    # literal for SQLite to pick it.
+    "CREATE INDEX IF NOT EXISTS idx_ex_open ON exchange_requests(user_id, id, status) "
+    f"WHERE status < {ExStatus.COMPLETED:d};",
+    # Same index the viewer creates for its per-user message paging.
+    "CREATE INDEX IF NOT EXISTS idx_user_messages_user_id ON user_messages(user_id, id);",
+)
+
+# Bump whenever a column is added to MIGRATION_COLUMNS or a data migration is added.
+SCHEMA_VERSION = 3
+
+# Columns added after the tables were first shipped, per table.
+MIGRATION_COLUMNS = {
+    "users": {
+        "id_number": "TEXT",
+        "id_card_file_id": "TEXT",
+        "selfie_with_id_file_id": "TEXT",
+        "email": "TEXT",
+        "attempts": "INTEGER DEFAULT 1",
+        "entry_count": "INTEGER DEFAULT 0",
+        "username": "TEXT",
+        "bio": "TEXT",
+        "profile_photo_file_id": "TEXT",
+        "pending_field": "TEXT",
+    },
+    "user_messages": {
+        "chat_type": "TEXT",
+        "file_data": "BLOB",
+        "file_path": "TEXT",
+        "file_mime": "TEXT",
+    },
+    "exchange_requests": {
+        "payout_tx_hash": "TEXT",
+        "payout_screenshot_file_id": "TEXT",
+        "completed_at": "TEXT",
+        "wallet_address": "TEXT",
+        "user_wallet_address": "TEXT",
+    },
+}
+
+
+def message_file_name(file_id: str, suffix: str = "") -> str:
+    safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in file_id)
+    return f"{MESSAGE_FILES_DIR}/{safe_id}{suffix}"
+
+
+async def move_message_blobs(conn: aiosqlite.Connection, files_root: Path) -> None:
+    """Write BLOBs logged before version 2 out to files and clear file_data."""
+    cursor = await conn.execute("SELECT id FROM user_messages WHERE file_data IS NOT NULL;")
+    msg_ids = [row["id"] for row in await cursor.fetchall()]
+    if msg_ids:
+        (files_root / MESSAGE_FILES_DIR).mkdir(parents=True, exist_ok=True)
+    # One row at a time so only a single BLOB is held in memory.
+    for msg_id in msg_ids:
+        cursor = await conn.execute(
+            "SELECT file_id, file_mime, file_data FROM user_messages WHERE id = ?;", (msg_id,)
         )
-        """
-    )
-    await conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            tx_hash TEXT,
-            screenshot_file_id TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+        row = await cursor.fetchone()
+        suffix = mimetypes.guess_extension(row["file_mime"] or "") or ""
+        rel_path = message_file_name(row["file_id"] or f"msg{msg_id}", suffix)
+        (files_root / rel_path).write_bytes(row["file_data"])
+        await conn.execute(
+            "UPDATE user_messages SET file_path = ?, file_data = NULL WHERE id = ?;",
+            (rel_path, msg_id),
         )
-        """
-    )
-    await conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS exchange_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            tx_hash TEXT,
-            screenshot_file_id TEXT,
-            status TEXT DEFAULT 'pending_admin',
-            approved_at TEXT,
-            expires_at TEXT,
-            payout_tx_hash TEXT,
-            payout_screenshot_file_id TEXT,
-            completed_at TEXT,
-            wallet_address TEXT,
-            user_wallet_address TEXT,
-            created_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+
+
+# Tables whose status column moved from TEXT to a code, with the code's default.
+STATUS_DEFAULTS = {
+    "users": UserStatus.PENDING,
+    "payments": PayStatus.PENDING,
+    "exchange_requests": ExStatus.PENDING_ADMIN,
+}
+STATUS_TEXT_RE = re.compile(r"\bstatus\s+TEXT(?:\s+DEFAULT\s+'\w*')?", re.IGNORECASE)
+
+
+async def quantize_status_columns(conn: aiosqlite.Connection) -> None:
+    """Rebuild tables created before version 3 so status holds integer codes.
+
+    SQLite cannot change a column's type in place, and TEXT affinity would store
+    the codes as strings, so each table is copied into one with the same
+    definition except for status, swapped in, and given back its indexes and
+    triggers.
+    """
+    # Keep the viewer's trigger on user_messages (which names users) from
+    # failing the rename while users is briefly missing.
+    await conn.execute("PRAGMA legacy_alter_table=ON;")
+    for table, default in STATUS_DEFAULTS.items():
+        cursor = await conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?;", (table,)
         )
-        """
-    )
-    await conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS user_messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            msg_type TEXT,
-            content TEXT,
-            file_id TEXT,
-            file_data BLOB,
-            file_mime TEXT,
-            chat_type TEXT,
-            created_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(telegram_id)
+        table_sql = (await cursor.fetchone())["sql"]
+        if not STATUS_TEXT_RE.search(table_sql):
+            continue
+        cursor = await conn.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL;",
+            (table,),
         )
-        """
-    )
-    await conn.commit()
-    # Ensure new columns exist if table was created previously
-    await ensure_user_columns(conn)
-    return conn
+        dependents = [row["sql"] for row in await cursor.fetchall()]
+        cursor = await conn.execute("SELECT name FROM pragma_table_info(?);", (table,))
+        columns = [row["name"] for row in await cursor.fetchall()]
+        # Unknown strings are copied as they are rather than lost.
+        codes = " ".join(f"WHEN '{code.name.lower()}' THEN {code.value}" for code in type(default))
+        select = ", ".join(
+            f"CASE status {codes} ELSE status END" if col == "status" else col for col in columns
+        )
+        new_sql = STATUS_TEXT_RE.sub(f"status INTEGER DEFAULT {default.value}", table_sql, count=1)
+        await conn.execute(new_sql.replace(table, f"{table}_new", 1))
+        await conn.execute(
+            f"INSERT INTO {table}_new ({', '.join(columns)}) SELECT {select} FROM {table};"
+        )
+        # Carry the AUTOINCREMENT high-water mark over, so deleted ids are not reused.
+        await conn.execute(
+            "UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = ?) WHERE name = ?;",
+            (table, f"{table}_new"),
+        )
+        await conn.execute(f"DROP TABLE {table};")
+        await conn.execute(f"ALTER TABLE {table}_new RENAME TO {table};")
+        for sql in dependents:
+            await conn.execute(sql)
+    await conn.execute("PRAGMA legacy_alter_table=OFF;")
 
 
-async def ensure_user_columns(conn: aiosqlite.Connection) -> None:
-    """Add missing columns for backwards compatibility."""
-    required_cols = {
-        "id_number": "ALTER TABLE users ADD COLUMN id_number TEXT;",
-        "id_card_file_id": "ALTER TABLE users ADD COLUMN id_card_file_id TEXT;",
-        "selfie_with_id_file_id": "ALTER TABLE users ADD COLUMN selfie_with_id_file_id TEXT;",
-        "email": "ALTER TABLE users ADD COLUMN email TEXT;",
-        "attempts": "ALTER TABLE users ADD COLUMN attempts INTEGER DEFAULT 1;",
-        "entry_count": "ALTER TABLE users ADD COLUMN entry_count INTEGER DEFAULT 0;",
-        "username": "ALTER TABLE users ADD COLUMN username TEXT;",
-        "bio": "ALTER TABLE users ADD COLUMN bio TEXT;",
-        "profile_photo_file_id": "ALTER TABLE users ADD COLUMN profile_photo_file_id TEXT;",
-        "pending_field": "ALTER TABLE users ADD COLUMN pending_field TEXT;",
-    }
-    # extra tables columns for exchange_requests
+async def ensure_user_columns(conn: aiosqlite.Connection, files_root: Path) -> None:
+    """Add missing columns for backwards compatibility.
+
+    Skipped once schema_meta records SCHEMA_VERSION; otherwise every ALTER
+    (and the data moves of newer versions) runs inside a single transaction.
+    """
     conn.row_factory = aiosqlite.Row
-    cursor = await conn.execute("PRAGMA table_info(users);")
-    existing = {row["name"] for row in await cursor.fetchall()}
-    for col, alter_sql in required_cols.items():
-        if col not in existing:
-            await conn.execute(alter_sql)
-    # ensure chat_type column in user_messages
-    cursor = await conn.execute("PRAGMA table_info(user_messages);")
-    msg_cols = {row["name"] for row in await cursor.fetchall()}
-    if "chat_type" not in msg_cols:
-        await conn.execute("ALTER TABLE user_messages ADD COLUMN chat_type TEXT;")
-    if "file_data" not in msg_cols:
-        await conn.execute("ALTER TABLE user_messages ADD COLUMN file_data BLOB;")
-    if "file_mime" not in msg_cols:
-        await conn.execute("ALTER TABLE user_messages ADD COLUMN file_mime TEXT;")
-    # ensure payout columns in exchange_requests
-    cursor = await conn.execute("PRAGMA table_info(exchange_requests);")
-    ex_cols = {row["name"] for row in await cursor.fetchall()}
-    if "payout_tx_hash" not in ex_cols:
-        await conn.execute("ALTER TABLE exchange_requests ADD COLUMN payout_tx_hash TEXT;")
-    if "payout_screenshot_file_id" not in ex_cols:
-        await conn.execute(
-            "ALTER TABLE exchange_requests ADD COLUMN payout_screenshot_file_id TEXT;"
-        )
-    if "completed_at" not in ex_cols:
-        await conn.execute("ALTER TABLE exchange_requests ADD COLUMN completed_at TEXT;")
-    if "wallet_address" not in ex_cols:
-        await conn.execute("ALTER TABLE exchange_requests ADD COLUMN wallet_address TEXT;")
-    if "user_wallet_address" not in ex_cols:
-        await conn.execute("ALTER TABLE exchange_requests ADD COLUMN user_wallet_address TEXT;")
-    await conn.commit()
+    cursor = await conn.execute("SELECT version FROM schema_meta;")
+    row = await cursor.fetchone()
+    version = row["version"] if row else 0
+    if version == SCHEMA_VERSION:
+        return
+    await conn.execute("BEGIN IMMEDIATE;")
+    # Column names of every migrated table in one query, as plain tuples.
+    tables = tuple(MIGRATION_COLUMNS)
+    conn.row_factory = None
+    cursor = await conn.execute(
+        f"""
+        SELECT m.name, p.name FROM sqlite_master AS m, pragma_table_info(m.name) AS p
+        WHERE m.type = 'table' AND m.name IN ({", ".join("?" * len(tables))});
+        """,
+        tables,
+    )
+    existing = set(await cursor.fetchall())
+    conn.row_factory = aiosqlite.Row
+    for table, columns in MIGRATION_COLUMNS.items():
+        for col, col_type in columns.items():
+            if (table, col) not in existing:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type};")
+    if version < 2:
+        await move_message_blobs(conn, files_root)
+    if version < 3:
+        await quantize_status_columns(conn)
+    await conn.execute("DELETE FROM schema_meta;")
+    await conn.execute("INSERT INTO schema_meta (version) VALUES (?);", (SCHEMA_VERSION,))
+    await conn.execute("COMMIT;")
+
+
+def status_label(enum: type[IntEnum], code: Any) -> str:
+    """Name shown for a stored status code; anything unrecognised is shown as stored."""
+    try:
+        return enum(code).name.lower()
+    except ValueError:
+        return str(code)
+
+
+def utc_now() -> str:
+    """ISO timestamp for created_at/updated_at; handlers take one and pass it to every write."""
+    return datetime.now(UTC).isoformat()
 
 
-async def set_user_status(conn: aiosqlite.Connection, telegram_id: int, status: str) -> None:
-    await conn.execute(
+async def set_user_status(
+    conn: DBPool, telegram_id: int, status: UserStatus, now: Optional[str] = None
+) -> None:
+    await conn.execute_write(
         "UPDATE users SET status = ?, updated_at = ? WHERE telegram_id = ?",
-        (status, datetime.now(UTC).isoformat(), telegram_id),
+        (status, now or utc_now(), telegram_id),
     )
-    await conn.commit()
+    forget_user_state(conn, telegram_id)
 
 
-async def set_pending_field(conn: aiosqlite.Connection, telegram_id: int, field: Optional[str]) -> None:
-    await conn.execute(
-        "UPDATE users SET pending_field = ?, updated_at = ? WHERE telegram_id = ?",
-        (field, datetime.now(UTC).isoformat(), telegram_id),
+async def set_review_state(
+    conn: DBPool, telegram_id: int, status: UserStatus, pending_field: Optional[str], now: Optional[str] = None
+) -> None:
+    """Status and pending_field always change together, so write them in one statement."""
+    await conn.execute_write(
+        "UPDATE users SET status = ?, pending_field = ?, updated_at = ? WHERE telegram_id = ?",
+        (status, pending_field, now or utc_now(), telegram_id),
     )
-    await conn.commit()
+    forget_user_state(conn, telegram_id)
 
 
-async def update_user_field(
-    conn: aiosqlite.Connection, telegram_id: int, field: str, value: str
-) -> None:
-    await conn.execute(
-        f"UPDATE users SET {field} = ?, updated_at = ? WHERE telegram_id = ?",
-        (value, datetime.now(UTC).isoformat(), telegram_id),
+# Columns a user can re-submit; each gets one fixed statement built at import. A re-submission
+# stores the value, clears pending_field and puts the user back into review in the same write.
+ALLOWED_USER_COLS = ("name", "id_number", "id_card_file_id", "selfie_with_id_file_id", "email")
+RESUBMIT_USER_FIELD_SQL = {
+    col: (
+        f"UPDATE users SET {col} = ?, pending_field = NULL, status = {UserStatus.PENDING:d}, updated_at = ? "
+        "WHERE telegram_id = ?"
     )
-    await conn.commit()
+    for col in ALLOWED_USER_COLS
+}
+
+
+async def resubmit_user_field(
+    conn: DBPool, telegram_id: int, field: str, value: str, now: Optional[str] = None
+) -> None:
+    # KeyError for anything outside ALLOWED_USER_COLS, so no column name is ever interpolated.
+    sql = RESUBMIT_USER_FIELD_SQL[field]
+    await conn.execute_write(sql, (value, now or utc_now(), telegram_id))
+    forget_user_state(conn, telegram_id)
 
 
-async def increment_entry_count(conn: aiosqlite.Connection, telegram_id: int) -> None:
-    await conn.execute(
+async def increment_entry_count(conn: DBPool, telegram_id: int, now: Optional[str] = None) -> None:
+    now = now or utc_now()
+    await conn.execute_write(
         """
         INSERT INTO users (telegram_id, entry_count, created_at, updated_at)
         VALUES (?, 1, ?, ?)
@@ -209,19 +613,44 @@ async def increment_entry_count(conn: aiosqlite.Connection, telegram_id: int) ->
             entry_count = COALESCE(entry_count, 0) + 1,
             updated_at = excluded.updated_at
         """,
-        (telegram_id, datetime.now(UTC).isoformat(), datetime.now(UTC).isoformat()),
+        (telegram_id, now, now),
     )
-    await conn.commit()
+    forget_user_state(conn, telegram_id)
 
 
-async def get_user(conn: aiosqlite.Connection, telegram_id: int) -> Optional[aiosqlite.Row]:
-    conn.row_factory = aiosqlite.Row
-    cursor = await conn.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-    return await cursor.fetchone()
+async def get_user(conn: DBPool, telegram_id: int) -> Optional[aiosqlite.Row]:
+    return await conn.fetchone("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+
+
+async def get_user_state(conn: DBPool, telegram_id: int) -> Optional[aiosqlite.Row]:
+    """status and pending_field only, for handlers that just branch on them.
+
+    Menu taps ask for this constantly, so results are cached per user for
+    USER_STATE_TTL. A result fetched while any user row was being written is
+    not cached, since it may predate that write.
+    """
+    now = time.monotonic()
+    hit = conn.user_states.get(telegram_id)
+    if hit and now - hit[0] < USER_STATE_TTL:
+        return hit[1]
+    epoch = conn.user_states_epoch
+    row = await conn.fetchone(
+        "SELECT status, pending_field FROM users WHERE telegram_id = ?", (telegram_id,)
+    )
+    if epoch == conn.user_states_epoch:
+        if len(conn.user_states) >= USER_STATE_CACHE_MAX:
+            conn.user_states.clear()
+        conn.user_states[telegram_id] = (now, row)
+    return row
+
+
+def forget_user_state(conn: DBPool, telegram_id: int) -> None:
+    conn.user_states.pop(telegram_id, None)
+    conn.user_states_epoch += 1
 
 
 async def insert_user(
-    conn: aiosqlite.Connection,
+    conn: DBPool,
     telegram_id: int,
     name: str,
     id_number: str,
@@ -231,20 +660,16 @@ async def insert_user(
     username: str,
     bio: str,
     profile_photo_file_id: str,
+    now: Optional[str] = None,
 ) -> None:
-    # keep attempts/created_at if user existed
-    existing = await get_user(conn, telegram_id)
-    if existing and existing["status"] == "needs_update":
-        attempts = existing["attempts"] or 1
-    else:
-        attempts = ((existing["attempts"] or 1) + 1) if existing else 1
-    entry_count = existing["entry_count"] if existing else 0
-    created_at = existing["created_at"] if existing else datetime.now(UTC).isoformat()
-    await conn.execute(
+    now = now or utc_now()
+    # Existing rows keep created_at and entry_count; attempts only grows when
+    # this is a fresh submission rather than a fix requested by the admin.
+    await conn.execute_write(
         """
         INSERT INTO users
             (telegram_id, name, id_number, id_card_file_id, selfie_with_id_file_id, email, username, bio, profile_photo_file_id, status, attempts, entry_count, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?, ?, ?)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 0, ?, ?)
         ON CONFLICT(telegram_id) DO UPDATE SET
             name = excluded.name,
             id_number = excluded.id_number,
@@ -254,10 +679,12 @@ async def insert_user(
             username = excluded.username,
             bio = excluded.bio,
             profile_photo_file_id = excluded.profile_photo_file_id,
-            status = 'pending',
-            attempts = excluded.attempts,
-            entry_count = excluded.entry_count,
-            created_at = excluded.created_at,
+            status = excluded.status,
+            attempts = CASE
+                WHEN users.status = ? THEN COALESCE(users.attempts, 1)
+                ELSE COALESCE(users.attempts, 1) + 1
+            END,
+            created_at = COALESCE(users.created_at, excluded.created_at),
             updated_at = excluded.updated_at
         """,
         (
@@ -270,46 +697,51 @@ async def insert_user(
             username,
             bio,
             profile_photo_file_id,
-            attempts,
-            entry_count,
-            created_at,
-            datetime.now(UTC).isoformat(),
+            UserStatus.PENDING,
+            now,
+            now,
+            UserStatus.NEEDS_UPDATE,
         ),
     )
-    await conn.commit()
+    forget_user_state(conn, telegram_id)
 
 
 async def insert_payment(
-    conn: aiosqlite.Connection, user_id: int, tx_hash: str, screenshot_file_id: str
+    conn: DBPool, user_id: int, tx_hash: str, screenshot_file_id: str, now: Optional[str] = None
 ) -> None:
-    await conn.execute(
+    await conn.execute_write(
         """
         INSERT INTO payments (user_id, tx_hash, screenshot_file_id, status, created_at)
-        VALUES (?, ?, ?, 'pending', ?)
+        VALUES (?, ?, ?, ?, ?)
         """,
-        (user_id, tx_hash, screenshot_file_id, datetime.now(UTC).isoformat()),
+        (user_id, tx_hash, screenshot_file_id, PayStatus.PENDING, now or utc_now()),
+    )
+
+
+async def settle_pending_payments(conn: DBPool, user_id: int, status: PayStatus) -> None:
+    """Approve or reject the user's pending payments; both admin actions share this statement."""
+    await conn.execute_write(
+        "UPDATE payments SET status = ? WHERE user_id = ? AND status = ?",
+        (status, user_id, PayStatus.PENDING),
     )
-    await conn.commit()
 
 
 async def insert_exchange_request(
-    conn: aiosqlite.Connection, user_id: int, tx_hash: str, screenshot_file_id: str
+    conn: DBPool, user_id: int, tx_hash: str, screenshot_file_id: str, now: Optional[str] = None
 ) -> int:
-    cursor = await conn.execute(
+    return await conn.execute_write(
         """
         INSERT INTO exchange_requests (user_id, tx_hash, screenshot_file_id, status, created_at)
-        VALUES (?, ?, ?, 'pending_admin', ?)
+        VALUES (?, ?, ?, ?, ?)
         """,
-        (user_id, tx_hash, screenshot_file_id, datetime.now(UTC).isoformat()),
+        (user_id, tx_hash, screenshot_file_id, ExStatus.PENDING_ADMIN, now or utc_now()),
     )
-    await conn.commit()
-    return cursor.lastrowid
 
 
 async def set_exchange_status(
-    conn: aiosqlite.Connection,
+    conn: DBPool,
     exchange_id: int,
-    status: str,
+    status: ExStatus,
     approved_at: Optional[str] = None,
     expires_at: Optional[str] = None,
     payout_tx_hash: Optional[str] = None,
@@ -318,7 +750,7 @@ async def set_exchange_status(
     wallet_address: Optional[str] = None,
     user_wallet_address: Optional[str] = None,
 ) -> None:
-    await conn.execute(
+    await conn.execute_write(
         """
         UPDATE exchange_requests
         SET status = ?,
@@ -343,89 +775,153 @@ async def set_exchange_status(
             exchange_id,
         ),
     )
-    await conn.commit()
 
 
-async def get_exchange(conn: aiosqlite.Connection, exchange_id: int) -> Optional[aiosqlite.Row]:
-    conn.row_factory = aiosqlite.Row
-    cursor = await conn.execute("SELECT * FROM exchange_requests WHERE id = ?", (exchange_id,))
-    return await cursor.fetchone()
+async def get_exchange(conn: DBPool, exchange_id: int) -> Optional[aiosqlite.Row]:
+    return await conn.fetchone("SELECT * FROM exchange_requests WHERE id = ?", (exchange_id,))
 
 
-async def get_last_completed_exchange_date(conn: aiosqlite.Connection, user_id: int) -> Optional[datetime]:
-    conn.row_factory = aiosqlite.Row
-    cursor = await conn.execute(
+async def get_exchange_with_user(conn: DBPool, exchange_id: int) -> Optional[aiosqlite.Row]:
+    """The exchange row plus the owner's info columns; telegram_id is NULL if the user row is gone."""
+    return await conn.fetchone(
         """
-        SELECT completed_at FROM exchange_requests
-        WHERE user_id = ? AND status = 'completed' AND completed_at IS NOT NULL
-        ORDER BY completed_at DESC LIMIT 1
+        SELECT e.*, u.telegram_id, u.name, u.id_number, u.email, u.username
+        FROM exchange_requests AS e LEFT JOIN users AS u ON u.telegram_id = e.user_id
+        WHERE e.id = ?
         """,
-        (user_id,),
+        (exchange_id,),
     )
-    row = await cursor.fetchone()
-    if row and row["completed_at"]:
-        try:
-            return datetime.fromisoformat(row["completed_at"])
-        except Exception:
-            return None
-    return None
+
+
+async def get_exchange_gate(conn: DBPool, user_id: int) -> Optional[aiosqlite.Row]:
+    """Everything show_exchange checks, in one query.
+
+    The user's info columns and status, the last completed exchange (a probe
+    of idx_ex_user_status_completed) and the newest still-open exchange id
+    (a seek on the partial idx_ex_open).
+    """
+    return await conn.fetchone(
+        f"""
+        SELECT u.telegram_id, u.name, u.id_number, u.email, u.status,
+            (SELECT MAX(completed_at) FROM exchange_requests
+             WHERE user_id = u.telegram_id AND status = ?) AS last_completed_at,
+            (SELECT id FROM exchange_requests
+             WHERE user_id = u.telegram_id AND status < {ExStatus.COMPLETED:d}
+             ORDER BY id DESC LIMIT 1) AS open_exchange_id
+        FROM users AS u WHERE u.telegram_id = ?
+        """,
+        (ExStatus.COMPLETED, user_id),
+    )
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _chat_type(update: Update) -> str:
+    chat = update.effective_chat
+    return chat.type if chat else ""
 
 
 async def log_user_message(
-    conn: aiosqlite.Connection,
+    conn: DBPool,
     user_id: int,
     msg_type: str,
     content: str = "",
     file_id: str = "",
     chat_type: str = "",
-    file_bytes: Optional[bytes] = None,
+    file_path: Optional[str] = None,
     file_mime: str = "",
+    now: Optional[str] = None,
 ) -> None:
-    await conn.execute(
-        """
-        INSERT INTO user_messages (user_id, msg_type, content, file_id, file_data, file_mime, chat_type, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
+    """Queue a message log row; it is inserted with the next group commit."""
+    conn.queue_write(
+        SQL_INSERT_USER_MESSAGE,
         (
             user_id,
             msg_type,
             content,
             file_id,
-            file_bytes,
+            file_path,
             file_mime,
             chat_type,
-            datetime.now(UTC).isoformat(),
+            now or utc_now(),
         ),
     )
-    await conn.commit()
+
+
+async def attach_message_file(bot, conn: DBPool, file_id: str) -> None:
+    file_path, file_mime = await download_message_file(bot, conn.files_root, file_id)
+    if file_path is not None:
+        # Queued behind the INSERT that logged the file_id, so the row exists by then.
+        conn.queue_write(SQL_ATTACH_MESSAGE_FILE, (file_path, file_mime, file_id))
+
+
+def attach_file_later(app: Application, conn: DBPool, file_id: str) -> None:
+    """Download a logged file in the background instead of before the log insert."""
+    if file_id:
+        app.create_task(attach_message_file(app.bot, conn, file_id))
+
+
+def notify_admin_later(context: CallbackContext, what: str, *sends: Awaitable[Any]) -> None:
+    """Send admin notifications in the background; the user's reply does not wait on them."""
+
+    async def run() -> None:
+        try:
+            await asyncio.gather(*sends)
+        except Exception as exc:  # pragma: no cover
+            logger.error("Failed to notify admin for %s: %s", what, exc)
+
+    context.application.create_task(run())
 
 
 async def log_bot_message(app: Application, chat_id: int, msg_type: str, content: str = "", file_id: str = "") -> None:
     """Log outgoing bot messages so they appear in the viewer."""
-    conn: aiosqlite.Connection = app.bot_data.get("db") if app and getattr(app, "bot_data", None) else None
+    conn: DBPool = app.bot_data.get("db") if app and getattr(app, "bot_data", None) else None
     if not conn:
         return
-    file_bytes = None
-    file_mime = ""
-    if file_id:
-        file_bytes, file_mime = await fetch_file_bytes(app.bot, file_id)
     await log_user_message(
         conn,
         chat_id,
         f"bot_{msg_type}",
         content=content,
         file_id=file_id,
-        file_bytes=file_bytes,
-        file_mime=file_mime,
         chat_type="bot",
     )
+    attach_file_later(app, conn, file_id)
+
+
+# Per-chat send buckets on top of the bot-wide AIORateLimiter: Telegram allows
+# about one message per second in a chat, with short bursts tolerated. Only the
+# most recently used chats keep a bucket.
+CHAT_SEND_RATE = 1
+CHAT_SEND_BURST = 3
+CHAT_LIMITERS_MAX = 1024
+
+
+def chat_limiter(context: CallbackContext, chat_id: Any) -> AbstractAsyncContextManager:
+    if chat_id is None:
+        return nullcontext()
+    limiters: "OrderedDict[Any, AsyncLimiter]" = context.bot_data["chat_limiters"]
+    limiter = limiters.get(chat_id)
+    if limiter is None:
+        limiter = limiters[chat_id] = AsyncLimiter(CHAT_SEND_BURST, CHAT_SEND_BURST / CHAT_SEND_RATE)
+        if len(limiters) > CHAT_LIMITERS_MAX:
+            limiters.popitem(last=False)
+    else:
+        limiters.move_to_end(chat_id)
+    return limiter
 
 
 async def send_message_logged(context: CallbackContext, *args, **kwargs):
     """Send a message and log it as bot_text."""
     chat_id = kwargs.get("chat_id") or (args[0] if args else None)
     text = kwargs.get("text", "")
-    result = await context.bot.send_message(*args, **kwargs)
+    async with chat_limiter(context, chat_id):
+        result = await context.bot.send_message(*args, **kwargs)
     try:
         if chat_id is not None:
             await log_bot_message(context.application, chat_id, "text", content=text)
@@ -438,7 +934,8 @@ async def send_photo_logged(context: CallbackContext, *args, **kwargs):
     """Send a photo and log it as bot_photo."""
     chat_id = kwargs.get("chat_id") or (args[0] if args else None)
     photo = kwargs.get("photo") or (args[1] if len(args) > 1 else None)
-    result = await context.bot.send_photo(*args, **kwargs)
+    async with chat_limiter(context, chat_id):
+        result = await context.bot.send_photo(*args, **kwargs)
     try:
         file_id = ""
         if hasattr(result, "photo") and result.photo:
@@ -452,13 +949,24 @@ async def send_photo_logged(context: CallbackContext, *args, **kwargs):
     return result
 
 
-def _logged_set(context: CallbackContext):
-    return context.chat_data.setdefault("_logged_message_ids", set())
+# bot_data dicts tracking multi-step exchange/payout conversations.
+FLOW_KEYS = ("payout_flow", "wallet_flow", "exchange_collect", "payout_wallet_collect")
+
+# Only recent message ids can be handled twice, so each chat keeps a bounded LRU.
+LOGGED_IDS_PER_CHAT = 1024
+
+
+def _logged_set(context: CallbackContext) -> "OrderedDict[int, None]":
+    return context.chat_data.setdefault("_logged_message_ids", OrderedDict())
 
 
 def mark_logged(context: CallbackContext, message_id: int) -> None:
     try:
-        _logged_set(context).add(message_id)
+        logged = _logged_set(context)
+        logged[message_id] = None
+        logged.move_to_end(message_id)
+        if len(logged) > LOGGED_IDS_PER_CHAT:
+            logged.popitem(last=False)
     except Exception:
         return
 
@@ -470,34 +978,32 @@ def already_logged(context: CallbackContext, message_id: int) -> bool:
         return False
 
 
-async def fetch_file_bytes(bot, file_id: str) -> Tuple[Optional[bytes], str]:
-    """Download file bytes+mime from Telegram."""
+async def download_message_file(bot, files_root: Path, file_id: str) -> Tuple[Optional[str], str]:
+    """Download a Telegram file to disk; return its path relative to files_root and its mime."""
     if not file_id:
         return None, ""
     try:
         file = await bot.get_file(file_id)
-        file_path = getattr(file, "file_path", "") or ""
-        mime = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
-        data: Optional[bytes] = None
-        if hasattr(file, "download_as_bytearray"):
-            try:
-                ba = await file.download_as_bytearray()
-                data = bytes(ba)
-            except Exception:
-                data = None
-        if data is None and hasattr(file, "download_to_memory"):
-            buf = bytearray()
-            await file.download_to_memory(out=buf)
-            data = bytes(buf)
-        return data, mime
+        tg_path = getattr(file, "file_path", "") or ""
+        mime = mimetypes.guess_type(tg_path)[0] or "application/octet-stream"
+        rel_path = message_file_name(file_id, Path(tg_path).suffix)
+        target = files_root / rel_path
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Download beside the target and rename, so readers never see a partial file.
+            partial = target.with_name(target.name + ".part")
+            await file.download_to_drive(partial)
+            partial.replace(target)
+        return rel_path, mime
     except Exception as exc:  # pragma: no cover
-        logger.debug("Failed to fetch file bytes: %s", exc)
+        logger.debug("Failed to download file: %s", exc)
         return None, ""
 
 
 async def reply_text_logged(message, context: CallbackContext, text: str, **kwargs):
     """Send reply_text and log as bot_text."""
-    result = await message.reply_text(text, **kwargs)
+    async with chat_limiter(context, message.chat_id):
+        result = await message.reply_text(text, **kwargs)
     try:
         await log_bot_message(context.application, message.chat_id, "text", content=text)
     except Exception as exc:  # pragma: no cover
@@ -510,24 +1016,28 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
         return
     if already_logged(context, update.message.message_id):
         return
-    # Handle admin payout flow messages
-    payout_flow = context.bot_data.get("payout_flow", {})
-    wallet_flow = context.bot_data.get("wallet_flow", {})
-    exchange_collect = context.bot_data.setdefault("exchange_collect", {})
-    payout_wallet_collect = context.bot_data.setdefault("payout_wallet_collect", {})
-    if update.effective_user and context.bot_data.get("config") and update.effective_user.id == context.bot_data["config"].admin_chat_id:
-        wflow = wallet_flow.get(update.effective_user.id)
+    # Flow dicts are created in post_init, so the common no-flow update costs
+    # four membership tests before falling through to logging.
+    payout_flow = context.bot_data["payout_flow"]
+    wallet_flow = context.bot_data["wallet_flow"]
+    exchange_collect = context.bot_data["exchange_collect"]
+    payout_wallet_collect = context.bot_data["payout_wallet_collect"]
+    sender_id = update.effective_user.id if update.effective_user else None
+    # Handle admin payout flow messages; only the admin's approval callbacks
+    # add wallet_flow/payout_flow entries, keyed by the admin's own id.
+    if sender_id in wallet_flow or sender_id in payout_flow:
+        wflow = wallet_flow.get(sender_id)
         if wflow and update.message.text:
             wallet_addr = update.message.text.strip()
             exchange_id = wflow["exchange_id"]
             user_id = wflow["user_id"]
-            conn: aiosqlite.Connection = context.bot_data["db"]
+            conn: DBPool = context.bot_data["db"]
             now = datetime.now(UTC)
             expires_at = now + timedelta(minutes=30)
             await set_exchange_status(
                 conn,
                 exchange_id,
-                "awaiting_transfer",
+                ExStatus.AWAITING_TRANSFER,
                 expires_at=expires_at.isoformat(),
                 wallet_address=wallet_addr,
             )
@@ -551,12 +1061,7 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
                     "⚠️ After this time, your request will be cancelled. Do not send after expiry.\n"
                     "📤 After transfer, first send the tx hash, then send the transaction image."
                 ),
-                reply_markup=InlineKeyboardMarkup(
-                    [
-                        [InlineKeyboardButton("📜 Rules", callback_data="show_rules")],
-                        [InlineKeyboardButton("🔄 Exchange", callback_data="show_exchange")],
-                    ]
-                ),
+                reply_markup=RULES_EXCHANGE_MARKUP,
             )
             # Track that we are waiting for the user to send hash then screenshot
             exchange_collect[user_id] = {"exchange_id": exchange_id, "stage": "wait_hash"}
@@ -567,16 +1072,16 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
             await reply_text_logged(update.message, context, 
                 f"{info_text}\nWallet sent to user for exchange #{exchange_id}."
             )
-            wallet_flow.pop(update.effective_user.id, None)
+            wallet_flow.pop(sender_id, None)
             return
-        flow = payout_flow.get(update.effective_user.id)
+        flow = payout_flow.get(sender_id)
         if flow:
             stage = flow.get("stage")
             if stage in {"wait_hash_or_photo", "wait_hash"} and update.message.text:
                 flow["payout_tx_hash"] = update.message.text.strip()
                 if flow.get("payout_screenshot_file_id"):
                     await finalize_payout(update, context, flow)
-                    payout_flow.pop(update.effective_user.id, None)
+                    payout_flow.pop(sender_id, None)
                     return
                 flow["stage"] = "wait_photo"
                 await reply_text_logged(update.message, context, 
@@ -587,7 +1092,7 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
                 flow["payout_screenshot_file_id"] = update.message.photo[-1].file_id
                 if flow.get("payout_tx_hash"):
                     await finalize_payout(update, context, flow)
-                    payout_flow.pop(update.effective_user.id, None)
+                    payout_flow.pop(sender_id, None)
                     return
                 flow["stage"] = "wait_hash"
                 await reply_text_logged(update.message, context, 
@@ -596,34 +1101,34 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
                 return
 
     # Handle user-side exchange submission after wallet approval
-    if update.effective_user:
-        wallet_wait = payout_wallet_collect.get(update.effective_user.id)
+    if sender_id in payout_wallet_collect or sender_id in exchange_collect:
+        wallet_wait = payout_wallet_collect.get(sender_id)
         if wallet_wait:
             if not update.message.text:
                 await reply_text_logged(update.message, context, "Please send your BEP20 wallet address as text.")
                 return
             exchange_id = wallet_wait["exchange_id"]
             wallet_addr = update.message.text.strip()
-            conn: aiosqlite.Connection = context.bot_data["db"]
+            conn: DBPool = context.bot_data["db"]
             await set_exchange_status(
                 conn,
                 exchange_id,
-                "awaiting_payout",
+                ExStatus.AWAITING_PAYOUT,
                 user_wallet_address=wallet_addr,
             )
             await log_user_message(
                 conn,
-                update.effective_user.id,
+                sender_id,
                 "payout_wallet",
                 content=wallet_addr,
-                chat_type=update.effective_chat.type if update.effective_chat else "",
+                chat_type=_chat_type(update),
             )
             if update.message:
                 mark_logged(context, update.message.message_id)
-            payout_wallet_collect.pop(update.effective_user.id, None)
+            payout_wallet_collect.pop(sender_id, None)
             await reply_text_logged(update.message, context, "Wallet received. Your payout is being prepared.")
 
-            user_row = await get_user(conn, update.effective_user.id)
+            user_row = await get_user(conn, sender_id)
             username = f"@{update.effective_user.username}" if update.effective_user.username else "No username"
             info_text = build_user_info_text(
                 user_row, username, prefix=f"Exchange #{exchange_id} (payout wallet received)"
@@ -639,10 +1144,10 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
             )
             return
 
-        uflow = exchange_collect.get(update.effective_user.id)
+        uflow = exchange_collect.get(sender_id)
         if uflow:
             exchange_id = uflow["exchange_id"]
-            conn: aiosqlite.Connection = context.bot_data["db"]
+            conn: DBPool = context.bot_data["db"]
             if uflow["stage"] == "wait_hash":
                 if not update.message.text:
                     await reply_text_logged(update.message, context, "Please send the transaction hash.")
@@ -659,20 +1164,19 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
                 tx_hash = uflow.get("tx_hash", "")
                 screenshot_file_id = photo.file_id
                 # Persist on exchange record
-                await conn.execute(
+                await conn.execute_write(
                     """
                     UPDATE exchange_requests
-                    SET tx_hash = ?, screenshot_file_id = ?, status = 'pending_admin'
+                    SET tx_hash = ?, screenshot_file_id = ?, status = ?
                     WHERE id = ?
                     """,
-                    (tx_hash, screenshot_file_id, exchange_id),
+                    (tx_hash, screenshot_file_id, ExStatus.PENDING_ADMIN, exchange_id),
                 )
-                await conn.commit()
-                exchange_collect.pop(update.effective_user.id, None)
+                exchange_collect.pop(sender_id, None)
                 await reply_text_logged(update.message, context, "Payment submitted. Await admin approval.")
 
                 # Notify admin with full user info and screenshot
-                user_row = await get_user(conn, update.effective_user.id)
+                user_row = await get_user(conn, sender_id)
                 username = f"@{update.effective_user.username}" if update.effective_user.username else "No username"
                 info_text = build_user_info_text(
                     user_row, username, prefix=f"Exchange request #{exchange_id} (payment submitted)"
@@ -692,17 +1196,19 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
                     ]
                 )
                 try:
-                    await send_message_logged(
-                        context,
-                        chat_id=context.bot_data["config"].admin_chat_id,
-                        text=f"{info_text}\nUser tx hash: {tx_hash or '---'}",
-                        reply_markup=keyboard,
-                    )
-                    await send_photo_logged(
-                        context,
-                        chat_id=context.bot_data["config"].admin_chat_id,
-                        photo=screenshot_file_id,
-                        caption=f"{info_text}\nUser tx hash: {tx_hash or '---'}",
+                    await asyncio.gather(
+                        send_message_logged(
+                            context,
+                            chat_id=context.bot_data["config"].admin_chat_id,
+                            text=f"{info_text}\nUser tx hash: {tx_hash or '---'}",
+                            reply_markup=keyboard,
+                        ),
+                        send_photo_logged(
+                            context,
+                            chat_id=context.bot_data["config"].admin_chat_id,
+                            photo=screenshot_file_id,
+                            caption=f"{info_text}\nUser tx hash: {tx_hash or '---'}",
+                        ),
                     )
                 except BadRequest as exc:
                     logger.error("Failed to notify admin of exchange payment: %s", exc)
@@ -712,16 +1218,12 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
     msg_type = "text"
     content = msg.text or msg.caption or ""
     file_id = ""
-    file_bytes = None
-    file_mime = ""
     if msg.photo:
         msg_type = "photo"
         file_id = msg.photo[-1].file_id
-        file_bytes, file_mime = await fetch_file_bytes(context.bot, file_id)
     elif msg.document:
         msg_type = "document"
         file_id = msg.document.file_id
-        file_bytes, file_mime = await fetch_file_bytes(context.bot, file_id)
     await log_user_message(
         context.bot_data["db"],
         msg.from_user.id,
@@ -729,9 +1231,8 @@ async def log_any_message(update: Update, context: CallbackContext) -> None:
         content=content,
         file_id=file_id,
         chat_type=msg.chat.type if msg.chat else "",
-        file_bytes=file_bytes,
-        file_mime=file_mime,
     )
+    attach_file_later(context.application, context.bot_data["db"], file_id)
     mark_logged(context, msg.message_id)
 
 
@@ -740,38 +1241,39 @@ async def finalize_payout(update: Update, context: CallbackContext, flow: dict)
     user_id = flow.get("user_id")
     payout_tx_hash = flow.get("payout_tx_hash", "")
     payout_screenshot_file_id = flow.get("payout_screenshot_file_id", "")
-    conn: aiosqlite.Connection = context.bot_data["db"]
+    conn: DBPool = context.bot_data["db"]
     await set_exchange_status(
         conn,
         exchange_id,
-        "completed",
+        ExStatus.COMPLETED,
         payout_tx_hash=payout_tx_hash,
         payout_screenshot_file_id=payout_screenshot_file_id,
-        completed_at=datetime.now(UTC).isoformat(),
+        completed_at=utc_now(),
     )
     # notify user
     text = (
         "Your exchange has been completed.\n"
-        f"Payout tx hash: {payout_tx_hash or '---'}"
+        f"Payout tx hash: {payout_tx_hash or '---'}\n"
+        "Please allow up to 48 hours for your token to arrive."
     )
-    await send_message_logged(
-        context,
-        chat_id=user_id,
-        text=text + "\nPlease allow up to 48 hours for your token to arrive.",
-        reply_markup=InlineKeyboardMarkup(
-            [
-                [InlineKeyboardButton("📜 Rules", callback_data="show_rules")],
-                [InlineKeyboardButton("🔄 Exchange", callback_data="show_exchange")],
-            ]
-        ),
-    )
-    if payout_screenshot_file_id:
-        await send_photo_logged(
+    sends = [
+        send_message_logged(
             context,
             chat_id=user_id,
-            photo=payout_screenshot_file_id,
-            caption="Payout screenshot",
+            text=text,
+            reply_markup=RULES_EXCHANGE_MARKUP,
+        )
+    ]
+    if payout_screenshot_file_id:
+        sends.append(
+            send_photo_logged(
+                context,
+                chat_id=user_id,
+                photo=payout_screenshot_file_id,
+                caption="Payout screenshot",
+            )
         )
+    await asyncio.gather(*sends)
     await reply_text_logged(update.message, context, 
         f"Payout sent to user {user_id} for exchange #{exchange_id}."
     )
@@ -813,19 +1315,21 @@ async def get_profile_info(update: Update, context: CallbackContext) -> dict:
     bio = ""
     profile_photo_file_id = ""
 
-    try:
-        chat = await context.bot.get_chat(user.id)
-        if chat and getattr(chat, "bio", None):
-            bio = chat.bio or ""
-    except Exception as exc:  # pragma: no cover - non critical
-        logger.debug("Could not fetch bio: %s", exc)
+    # Independent API calls, so both round trips overlap.
+    chat, photos = await asyncio.gather(
+        context.bot.get_chat(user.id),
+        context.bot.get_user_profile_photos(user.id, limit=1),
+        return_exceptions=True,
+    )
+    if isinstance(chat, Exception):  # pragma: no cover - non critical
+        logger.debug("Could not fetch bio: %s", chat)
+    elif chat and getattr(chat, "bio", None):
+        bio = chat.bio or ""
 
-    try:
-        photos = await context.bot.get_user_profile_photos(user.id, limit=1)
-        if photos and photos.total_count > 0:
-            profile_photo_file_id = photos.photos[0][-1].file_id
-    except Exception as exc:  # pragma: no cover - non critical
-        logger.debug("Could not fetch profile photo: %s", exc)
+    if isinstance(photos, Exception):  # pragma: no cover - non critical
+        logger.debug("Could not fetch profile photo: %s", photos)
+    elif photos and photos.total_count > 0:
+        profile_photo_file_id = photos.photos[0][-1].file_id
 
     return {
         "username": username or "",
@@ -835,13 +1339,15 @@ async def get_profile_info(update: Update, context: CallbackContext) -> dict:
 
 
 async def upsert_profile_meta(
-    conn: aiosqlite.Connection,
+    conn: DBPool,
     telegram_id: int,
     username: str,
     bio: str,
     profile_photo_file_id: str,
+    now: Optional[str] = None,
 ) -> None:
-    await conn.execute(
+    now = now or utc_now()
+    await conn.execute_write(
         """
         INSERT INTO users (telegram_id, username, bio, profile_photo_file_id, created_at, updated_at)
         VALUES (?, ?, ?, ?, ?, ?)
@@ -856,22 +1362,25 @@ async def upsert_profile_meta(
             username,
             bio,
             profile_photo_file_id,
-            datetime.now(UTC).isoformat(),
-            datetime.now(UTC).isoformat(),
+            now,
+            now,
         ),
     )
-    await conn.commit()
+    forget_user_state(conn, telegram_id)
 
 
 async def start(update: Update, context: CallbackContext) -> int:
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    await increment_entry_count(conn, update.effective_user.id)
+    user_id = update.effective_user.id
+    conn: DBPool = context.bot_data["db"]
+    now = utc_now()
+    await increment_entry_count(conn, user_id, now=now)
     await log_user_message(
         conn,
-        update.effective_user.id,
+        user_id,
         "start",
         content="User tapped /start",
-        chat_type=update.effective_chat.type if update.effective_chat else "",
+        chat_type=_chat_type(update),
+        now=now,
     )
     if update.message:
         mark_logged(context, update.message.message_id)
@@ -879,13 +1388,14 @@ async def start(update: Update, context: CallbackContext) -> int:
     profile_info = await get_profile_info(update, context)
     await upsert_profile_meta(
         conn,
-        update.effective_user.id,
+        user_id,
         profile_info["username"],
         profile_info["bio"],
         profile_info["profile_photo_file_id"],
+        now=now,
     )
-    user = await get_user(conn, update.effective_user.id)
-    status = user["status"] if user else "new"
+    user = await get_user_state(conn, user_id)
+    status = user["status"] if user else None
     keyboard = build_main_menu(status)
     prompt = "👋 Hi! Please choose an option:"
     if update.message:
@@ -896,11 +1406,32 @@ async def start(update: Update, context: CallbackContext) -> int:
     return SELECT
 
 
+# Re-entry prompt and conversation state for each field the admin can flag.
+NEEDS_UPDATE_PROMPTS = {
+    "name": ("⚠️ Your name seems incorrect. Please enter your full name:", NAME),
+    "idnumber": ("⚠️ Your ID number seems incorrect. Please enter it again:", ID_NUMBER),
+    "idcard": ("⚠️ Your ID card photo seems unclear. Please re-upload it:", ID_CARD_PHOTO),
+    "selfie": ("⚠️ Your selfie with ID seems unclear. Please re-upload it:", SELFIE_WITH_ID),
+    "email": ("⚠️ Your email seems incorrect. Please enter it again:", EMAIL),
+}
+DEFAULT_NAME_PROMPT = ("✍️ Please enter your full name:", NAME)
+RULES_TEXT = (
+    "📜 Rules:\n"
+    "1) ✅ After full verification you may proceed to change.\n"
+    "2) ⏳ Verification takes up to 48 hours.\n"
+    "3) 🕑 After sending MML token, wait at least 48 hours.\n"
+    "4) 📈 Max change amount for start is 100 MML.\n"
+    "5) 🛡️ Bot is for active team members; service stops if misuse is found.\n"
+    "6) 🔁 You may request exchange only once every 30 days.\n"
+    "7) 💸 Exchange is processed with a 12% fee."
+)
+
+
 async def begin_auth(update: Update, context: CallbackContext) -> int:
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
-    if user and user["status"] == "approved":
-        keyboard = build_main_menu("approved")
+    conn: DBPool = context.bot_data["db"]
+    user = await get_user_state(conn, update.effective_user.id)
+    if user and user["status"] == UserStatus.APPROVED:
+        keyboard = build_main_menu(UserStatus.APPROVED)
         await update.callback_query.answer()
         try:
             await update.callback_query.edit_message_text(
@@ -909,17 +1440,10 @@ async def begin_auth(update: Update, context: CallbackContext) -> int:
         except BadRequest as exc:
             logger.debug("Skip edit_message_text (already set): %s", exc)
         return SELECT
-    if user and user["status"] == "needs_update":
+    if user and user["status"] == UserStatus.NEEDS_UPDATE:
         await update.callback_query.answer()
         pending_field = user["pending_field"] or ""
-        field_mapping = {
-            "name": ("⚠️ Your name seems incorrect. Please enter your full name:", NAME),
-            "idnumber": ("⚠️ Your ID number seems incorrect. Please enter it again:", ID_NUMBER),
-            "idcard": ("⚠️ Your ID card photo seems unclear. Please re-upload it:", ID_CARD_PHOTO),
-            "selfie": ("⚠️ Your selfie with ID seems unclear. Please re-upload it:", SELFIE_WITH_ID),
-            "email": ("⚠️ Your email seems incorrect. Please enter it again:", EMAIL),
-        }
-        prompt, state = field_mapping.get(pending_field, ("✍️ Please enter your full name:", NAME))
+        prompt, state = NEEDS_UPDATE_PROMPTS.get(pending_field, DEFAULT_NAME_PROMPT)
         try:
             await update.callback_query.edit_message_text(prompt)
         except BadRequest as exc:
@@ -935,9 +1459,9 @@ async def begin_auth(update: Update, context: CallbackContext) -> int:
 
 async def show_rules(update: Update, context: CallbackContext) -> int:
     await update.callback_query.answer()
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
-    status = user["status"] if user else "new"
+    conn: DBPool = context.bot_data["db"]
+    user = await get_user_state(conn, update.effective_user.id)
+    status = user["status"] if user else None
     if update.callback_query.data == "back_to_menu":
         keyboard = build_main_menu(status)
         try:
@@ -945,19 +1469,9 @@ async def show_rules(update: Update, context: CallbackContext) -> int:
         except BadRequest as exc:
             logger.debug("Skip edit_message_text (already set): %s", exc)
         return SELECT
-    text = (
-        "📜 Rules:\n"
-        "1) ✅ After full verification you may proceed to change.\n"
-        "2) ⏳ Verification takes up to 48 hours.\n"
-        "3) 🕑 After sending MML token, wait at least 48 hours.\n"
-        "4) 📈 Max change amount for start is 100 MML.\n"
-        "5) 🛡️ Bot is for active team members; service stops if misuse is found.\n"
-        "6) 🔁 You may request exchange only once every 30 days.\n"
-        "7) 💸 Exchange is processed with a 12% fee."
-    )
     keyboard = build_rules_menu(status)
     try:
-        await update.callback_query.edit_message_text(text, reply_markup=keyboard)
+        await update.callback_query.edit_message_text(RULES_TEXT, reply_markup=keyboard)
     except BadRequest as exc:
         logger.debug("Skip edit_message_text (already set): %s", exc)
     return SELECT
@@ -965,10 +1479,11 @@ async def show_rules(update: Update, context: CallbackContext) -> int:
 
 async def show_exchange(update: Update, context: CallbackContext) -> int:
     await update.callback_query.answer()
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
-    status = user["status"] if user else "new"
-    if status != "approved":
+    tg_user = update.effective_user
+    conn: DBPool = context.bot_data["db"]
+    user = await get_exchange_gate(conn, tg_user.id)
+    status = user["status"] if user else None
+    if status != UserStatus.APPROVED:
         text = "⛔ You must be approved first. Please verify, then try Exchange."
         keyboard = build_rules_menu(status)
         try:
@@ -976,7 +1491,7 @@ async def show_exchange(update: Update, context: CallbackContext) -> int:
         except BadRequest as exc:
             logger.debug("Skip edit_message_text (already set): %s", exc)
         return SELECT
-    last_completed = await get_last_completed_exchange_date(conn, update.effective_user.id)
+    last_completed = parse_timestamp(user["last_completed_at"])
     if last_completed:
         now = datetime.now(UTC)
         delta = now - last_completed
@@ -993,17 +1508,7 @@ async def show_exchange(update: Update, context: CallbackContext) -> int:
             return SELECT
 
     # Prevent duplicate open exchange
-    conn.row_factory = aiosqlite.Row
-    cursor = await conn.execute(
-        """
-        SELECT id FROM exchange_requests
-        WHERE user_id = ? AND status IN ('pending_admin','awaiting_wallet','awaiting_transfer','awaiting_user_wallet','awaiting_payout')
-        ORDER BY id DESC LIMIT 1
-        """,
-        (update.effective_user.id,),
-    )
-    existing = await cursor.fetchone()
-    if existing:
+    if user["open_exchange_id"] is not None:
         try:
             await update.callback_query.edit_message_text(
                 "Your exchange request is already waiting for admin. Please wait.",
@@ -1013,31 +1518,19 @@ async def show_exchange(update: Update, context: CallbackContext) -> int:
             logger.debug("Skip edit_message_text (already set): %s", exc)
         return SELECT
 
-    exchange_id = await insert_exchange_request(conn, update.effective_user.id, "", "")
-    info_text = build_user_info_text(user, f"@{update.effective_user.username}" if update.effective_user.username else "No username", prefix=f"Exchange request #{exchange_id}")
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Allow exchange ✅",
-                    callback_data=f"start_ex_approve:{exchange_id}",
-                ),
-                InlineKeyboardButton(
-                    "Reject exchange ❌",
-                    callback_data=f"start_ex_reject:{exchange_id}",
-                ),
-            ]
-        ]
-    )
-    try:
-        await send_message_logged(
+    exchange_id = await insert_exchange_request(conn, tg_user.id, "", "")
+    info_text = build_user_info_text(user, f"@{tg_user.username}" if tg_user.username else "No username", prefix=f"Exchange request #{exchange_id}")
+    keyboard = build_exchange_request_keyboard(exchange_id)
+    notify_admin_later(
+        context,
+        "exchange request",
+        send_message_logged(
             context,
             chat_id=context.bot_data["config"].admin_chat_id,
             text=info_text,
             reply_markup=keyboard,
-        )
-    except BadRequest as exc:
-        logger.error("Failed to notify admin for exchange request: %s", exc)
+        ),
+    )
 
     try:
         await update.callback_query.edit_message_text(
@@ -1048,76 +1541,83 @@ async def show_exchange(update: Update, context: CallbackContext) -> int:
     return SELECT
 
 
-async def handle_pending_update(update: Update, context: CallbackContext) -> Optional[int]:
-    if not update.message:
-        return None
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
-    if not user or user["status"] != "needs_update":
-        return None
-    pending_field = user["pending_field"] or ""
-
-    # Validate and update based on pending_field
-    if pending_field == "name":
-        if not update.message.text:
-            await reply_text_logged(update.message, context, "Please enter your full name in English letters only.")
-            return None
-        name = update.message.text.strip()
-        if not is_english_name(name):
-            await reply_text_logged(update.message, context, "Invalid name. Use English letters only.")
-            return None
-        await update_user_field(conn, user["telegram_id"], "name", name)
-        await finalize_pending_update(context, user, "Name", value=name)
-        await reply_text_logged(update.message, context, "Name updated. Await admin review.")
-        return ConversationHandler.END
+# ASCII letters, spaces, hyphens and apostrophes, with at least one letter. The
+# leading run excludes letters so a failing match never backtracks.
+ENGLISH_NAME_RE = re.compile(r"[ '\-]*[A-Za-z][A-Za-z '\-]*")
 
-    if pending_field == "idnumber":
-        if not update.message.text:
-            await reply_text_logged(update.message, context, "Please enter your ID number (digits).")
-            return None
-        idnum = update.message.text.strip()
-        if not idnum.isdigit():
-            await reply_text_logged(update.message, context, "Invalid ID number. Use digits only.")
-            return None
-        await update_user_field(conn, user["telegram_id"], "id_number", idnum)
-        await finalize_pending_update(context, user, "ID number", value=idnum)
-        await reply_text_logged(update.message, context, "ID number updated. Await admin review.")
-        return ConversationHandler.END
 
-    if pending_field == "idcard":
-        if not update.message.photo:
-            await reply_text_logged(update.message, context, "Please resend a clear photo of your ID card.")
-            return None
-        file_id = update.message.photo[-1].file_id
-        await update_user_field(conn, user["telegram_id"], "id_card_file_id", file_id)
-        await finalize_pending_update(context, user, "ID card photo", file_id=file_id)
-        await reply_text_logged(update.message, context, "ID card photo updated. Await admin review.")
-        return ConversationHandler.END
+def is_english_name(text: str) -> bool:
+    return bool(text) and ENGLISH_NAME_RE.fullmatch(text) is not None
+
+
+@dataclass(frozen=True)
+class PendingUpdate:
+    """How handle_pending_update takes a re-submission of one flagged field."""
+
+    column: str
+    label: str
+    missing: str  # reply when the message has no text (or photo)
+    done: str
+    photo: bool = False
+    check: Optional[Callable[[str], bool]] = None
+    invalid: str = ""
+
+
+PENDING_UPDATES = {
+    "name": PendingUpdate(
+        "name", "Name", "Please enter your full name in English letters only.",
+        "Name updated. Await admin review.",
+        check=is_english_name, invalid="Invalid name. Use English letters only.",
+    ),
+    "idnumber": PendingUpdate(
+        "id_number", "ID number", "Please enter your ID number (digits).",
+        "ID number updated. Await admin review.",
+        check=str.isdigit, invalid="Invalid ID number. Use digits only.",
+    ),
+    "idcard": PendingUpdate(
+        "id_card_file_id", "ID card photo", "Please resend a clear photo of your ID card.",
+        "ID card photo updated. Await admin review.", photo=True,
+    ),
+    "selfie": PendingUpdate(
+        "selfie_with_id_file_id", "Selfie with ID", "Please resend a clear selfie holding the ID card.",
+        "Selfie updated. Await admin review.", photo=True,
+    ),
+    "email": PendingUpdate(
+        "email", "Email", "Please enter your email.", "Email updated. Await admin review.",
+    ),
+}
 
-    if pending_field == "selfie":
-        if not update.message.photo:
-            await reply_text_logged(update.message, context, "Please resend a clear selfie holding the ID card.")
-            return None
-        file_id = update.message.photo[-1].file_id
-        await update_user_field(conn, user["telegram_id"], "selfie_with_id_file_id", file_id)
-        await finalize_pending_update(context, user, "Selfie with ID", file_id=file_id)
-        await reply_text_logged(update.message, context, "Selfie updated. Await admin review.")
-        return ConversationHandler.END
 
-    if pending_field == "email":
-        if not update.message.text:
-            await reply_text_logged(update.message, context, "Please enter your email.")
-            return None
-        email = update.message.text.strip()
-        await update_user_field(conn, user["telegram_id"], "email", email)
-        await finalize_pending_update(context, user, "Email", value=email)
-        await reply_text_logged(update.message, context, "Email updated. Await admin review.")
-        return ConversationHandler.END
+async def handle_pending_update(update: Update, context: CallbackContext) -> Optional[int]:
+    if not update.message:
+        return None
+    conn: DBPool = context.bot_data["db"]
+    # Runs for every incoming message, so probe the narrow state first.
+    state = await get_user_state(conn, update.effective_user.id)
+    if not state or state["status"] != UserStatus.NEEDS_UPDATE:
+        return None
+    spec = PENDING_UPDATES.get(state["pending_field"] or "")
+    if spec is None:
+        return None
 
-    return None
+    if spec.photo:
+        value = update.message.photo[-1].file_id if update.message.photo else None
+    else:
+        value = update.message.text.strip() if update.message.text else None
+    if value is None:
+        await reply_text_logged(update.message, context, spec.missing)
+        return None
+    if spec.check and not spec.check(value):
+        await reply_text_logged(update.message, context, spec.invalid)
+        return None
+    user = await get_user(conn, update.effective_user.id)
+    await finalize_pending_update(context, user, spec.label, spec.column, value)
+    await reply_text_logged(update.message, context, spec.done)
+    return ConversationHandler.END
 
 
 async def collect_name(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     if not update.message or not update.message.text:
         await reply_text_logged(update.message, context, "Invalid input. Please enter your full name (text only).")
         return NAME
@@ -1128,28 +1628,26 @@ async def collect_name(update: Update, context: CallbackContext) -> int:
         )
         return NAME
     context.user_data["name"] = name
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    existing = await get_user(conn, update.effective_user.id)
-    if existing and existing["status"] == "needs_update":
-        await update_user_field(conn, update.effective_user.id, "name", name)
-        await set_pending_field(conn, update.effective_user.id, None)
-        await set_user_status(conn, update.effective_user.id, "pending")
+    conn: DBPool = context.bot_data["db"]
+    existing = await get_user(conn, user_id)
+    if existing and existing["status"] == UserStatus.NEEDS_UPDATE:
+        await resubmit_user_field(conn, user_id, "name", name)
         await send_full_info_to_admin(
             context,
-            user_id=update.effective_user.id,
-            id_card_file_id=existing.get("id_card_file_id"),
-            selfie_file_id=existing.get("selfie_with_id_file_id"),
-            keyboard=build_verification_keyboard(update.effective_user.id),
+            user_id=user_id,
+            id_card_file_id=existing["id_card_file_id"],
+            selfie_file_id=existing["selfie_with_id_file_id"],
+            keyboard=build_verification_keyboard(user_id),
             prefix="Verification update:",
         )
         await reply_text_logged(update.message, context, "✅ Name updated. Await admin review.")
         return ConversationHandler.END
     await log_user_message(
         context.bot_data["db"],
-        update.effective_user.id,
+        user_id,
         "name",
         context.user_data["name"],
-        chat_type=update.effective_chat.type if update.effective_chat else "",
+        chat_type=_chat_type(update),
     )
     if update.message:
         mark_logged(context, update.message.message_id)
@@ -1158,37 +1656,34 @@ async def collect_name(update: Update, context: CallbackContext) -> int:
 
 
 async def collect_id_card(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     photo = update.message.photo[-1] if update.message and update.message.photo else None
     if not photo:
         await reply_text_logged(update.message, context, "Invalid input. Please send a photo of your ID card.")
         return ID_CARD_PHOTO
     context.user_data["id_card_file_id"] = photo.file_id
-    file_bytes, file_mime = await fetch_file_bytes(context.bot, photo.file_id)
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    existing = await get_user(conn, update.effective_user.id)
-    if existing and existing["status"] == "needs_update":
-        await update_user_field(conn, update.effective_user.id, "id_card_file_id", photo.file_id)
-        await set_pending_field(conn, update.effective_user.id, None)
-        await set_user_status(conn, update.effective_user.id, "pending")
+    conn: DBPool = context.bot_data["db"]
+    existing = await get_user(conn, user_id)
+    if existing and existing["status"] == UserStatus.NEEDS_UPDATE:
+        await resubmit_user_field(conn, user_id, "id_card_file_id", photo.file_id)
         await send_full_info_to_admin(
             context,
-            user_id=update.effective_user.id,
+            user_id=user_id,
             id_card_file_id=photo.file_id,
-            selfie_file_id=existing.get("selfie_with_id_file_id"),
-            keyboard=build_verification_keyboard(update.effective_user.id),
+            selfie_file_id=existing["selfie_with_id_file_id"],
+            keyboard=build_verification_keyboard(user_id),
             prefix="Verification update:",
         )
         await reply_text_logged(update.message, context, "✅ ID card photo updated. Await admin review.")
         return ConversationHandler.END
     await log_user_message(
         context.bot_data["db"],
-        update.effective_user.id,
+        user_id,
         "id_card_photo",
         file_id=photo.file_id,
-        chat_type=update.effective_chat.type if update.effective_chat else "",
-        file_bytes=file_bytes,
-        file_mime=file_mime,
+        chat_type=_chat_type(update),
     )
+    attach_file_later(context.application, context.bot_data["db"], photo.file_id)
     if update.message:
         mark_logged(context, update.message.message_id)
     await reply_text_logged(update.message, context, "Enter your ID number:")
@@ -1196,6 +1691,7 @@ async def collect_id_card(update: Update, context: CallbackContext) -> int:
 
 
 async def collect_id_number(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     if not update.message or not update.message.text:
         await reply_text_logged(update.message, context, "Invalid input. Please enter your ID number (text).")
         return ID_NUMBER
@@ -1204,28 +1700,26 @@ async def collect_id_number(update: Update, context: CallbackContext) -> int:
         await reply_text_logged(update.message, context, "Invalid input. Please enter your ID number using digits only.")
         return ID_NUMBER
     context.user_data["id_number"] = id_number
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    existing = await get_user(conn, update.effective_user.id)
-    if existing and existing["status"] == "needs_update":
-        await update_user_field(conn, update.effective_user.id, "id_number", id_number)
-        await set_pending_field(conn, update.effective_user.id, None)
-        await set_user_status(conn, update.effective_user.id, "pending")
+    conn: DBPool = context.bot_data["db"]
+    existing = await get_user(conn, user_id)
+    if existing and existing["status"] == UserStatus.NEEDS_UPDATE:
+        await resubmit_user_field(conn, user_id, "id_number", id_number)
         await send_full_info_to_admin(
             context,
-            user_id=update.effective_user.id,
-            id_card_file_id=existing.get("id_card_file_id"),
-            selfie_file_id=existing.get("selfie_with_id_file_id"),
-            keyboard=build_verification_keyboard(update.effective_user.id),
+            user_id=user_id,
+            id_card_file_id=existing["id_card_file_id"],
+            selfie_file_id=existing["selfie_with_id_file_id"],
+            keyboard=build_verification_keyboard(user_id),
             prefix="Verification update:",
         )
         await reply_text_logged(update.message, context, "✅ ID number updated. Await admin review.")
         return ConversationHandler.END
     await log_user_message(
         context.bot_data["db"],
-        update.effective_user.id,
+        user_id,
         "id_number",
         context.user_data["id_number"],
-        chat_type=update.effective_chat.type if update.effective_chat else "",
+        chat_type=_chat_type(update),
     )
     if update.message:
         mark_logged(context, update.message.message_id)
@@ -1234,6 +1728,7 @@ async def collect_id_number(update: Update, context: CallbackContext) -> int:
 
 
 async def collect_selfie_with_id(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     photo = update.message.photo[-1] if update.message and update.message.photo else None
     if not photo:
         await reply_text_logged(update.message, context, 
@@ -1241,34 +1736,28 @@ async def collect_selfie_with_id(update: Update, context: CallbackContext) -> in
         )
         return SELFIE_WITH_ID
     context.user_data["selfie_with_id_file_id"] = photo.file_id
-    file_bytes, file_mime = await fetch_file_bytes(context.bot, photo.file_id)
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    existing = await get_user(conn, update.effective_user.id)
-    if existing and existing["status"] == "needs_update":
-        await update_user_field(
-            conn, update.effective_user.id, "selfie_with_id_file_id", photo.file_id
-        )
-        await set_pending_field(conn, update.effective_user.id, None)
-        await set_user_status(conn, update.effective_user.id, "pending")
+    conn: DBPool = context.bot_data["db"]
+    existing = await get_user(conn, user_id)
+    if existing and existing["status"] == UserStatus.NEEDS_UPDATE:
+        await resubmit_user_field(conn, user_id, "selfie_with_id_file_id", photo.file_id)
         await send_full_info_to_admin(
             context,
-            user_id=update.effective_user.id,
-            id_card_file_id=existing.get("id_card_file_id"),
+            user_id=user_id,
+            id_card_file_id=existing["id_card_file_id"],
             selfie_file_id=photo.file_id,
-            keyboard=build_verification_keyboard(update.effective_user.id),
+            keyboard=build_verification_keyboard(user_id),
             prefix="Verification update:",
         )
         await reply_text_logged(update.message, context, "✅ Selfie with ID updated. Await admin review.")
         return ConversationHandler.END
     await log_user_message(
         context.bot_data["db"],
-        update.effective_user.id,
+        user_id,
         "selfie_with_id",
         file_id=photo.file_id,
-        chat_type=update.effective_chat.type if update.effective_chat else "",
-        file_bytes=file_bytes,
-        file_mime=file_mime,
+        chat_type=_chat_type(update),
     )
+    attach_file_later(context.application, context.bot_data["db"], photo.file_id)
     if update.message:
         mark_logged(context, update.message.message_id)
     await reply_text_logged(update.message, context, "Enter your email address:")
@@ -1276,40 +1765,42 @@ async def collect_selfie_with_id(update: Update, context: CallbackContext) -> in
 
 
 async def collect_email(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     if not update.message or not update.message.text:
         await reply_text_logged(update.message, context, "Invalid input. Please enter your email address (text).")
         return EMAIL
     context.user_data["email"] = update.message.text.strip()
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    existing = await get_user(conn, update.effective_user.id)
-    if existing and existing["status"] == "needs_update":
-        await update_user_field(conn, update.effective_user.id, "email", context.user_data["email"])
-        await set_pending_field(conn, update.effective_user.id, None)
-        await set_user_status(conn, update.effective_user.id, "pending")
+    conn: DBPool = context.bot_data["db"]
+    existing = await get_user(conn, user_id)
+    if existing and existing["status"] == UserStatus.NEEDS_UPDATE:
+        await resubmit_user_field(conn, user_id, "email", context.user_data["email"])
         await send_full_info_to_admin(
             context,
-            user_id=update.effective_user.id,
-            id_card_file_id=existing.get("id_card_file_id"),
-            selfie_file_id=existing.get("selfie_with_id_file_id"),
-            keyboard=build_verification_keyboard(update.effective_user.id),
+            user_id=user_id,
+            id_card_file_id=existing["id_card_file_id"],
+            selfie_file_id=existing["selfie_with_id_file_id"],
+            keyboard=build_verification_keyboard(user_id),
             prefix="Verification update:",
         )
         await reply_text_logged(update.message, context, "✅ Email updated. Await admin review.")
         return ConversationHandler.END
-    await log_user_message(
-        context.bot_data["db"],
-        update.effective_user.id,
-        "email",
-        context.user_data["email"],
-        chat_type=update.effective_chat.type if update.effective_chat else "",
-    )
+    now = utc_now()
     if update.message:
         mark_logged(context, update.message.message_id)
     profile_info = await get_profile_info(update, context)
 
+    # Queued after the profile fetch, so the log row and the user row share one commit.
+    await log_user_message(
+        conn,
+        user_id,
+        "email",
+        context.user_data["email"],
+        chat_type=_chat_type(update),
+        now=now,
+    )
     await insert_user(
         conn=conn,
-        telegram_id=update.effective_user.id,
+        telegram_id=user_id,
         name=context.user_data["name"],
         id_number=context.user_data["id_number"],
         id_card_file_id=context.user_data["id_card_file_id"],
@@ -1318,13 +1809,14 @@ async def collect_email(update: Update, context: CallbackContext) -> int:
         username=profile_info["username"],
         bio=profile_info["bio"],
         profile_photo_file_id=profile_info["profile_photo_file_id"],
+        now=now,
     )
     await send_full_info_to_admin(
         context,
-        user_id=update.effective_user.id,
+        user_id=user_id,
         id_card_file_id=context.user_data["id_card_file_id"],
         selfie_file_id=context.user_data["selfie_with_id_file_id"],
-        keyboard=build_verification_keyboard(update.effective_user.id),
+        keyboard=build_verification_keyboard(user_id),
     )
 
     await reply_text_logged(update.message, context, "Your info has been received. Please wait for admin approval.")
@@ -1342,7 +1834,7 @@ async def collect_exchange_hash(update: Update, context: CallbackContext) -> int
         update.effective_user.id,
         "exchange_hash",
         content=tx_hash,
-        chat_type=update.effective_chat.type if update.effective_chat else "",
+        chat_type=_chat_type(update),
     )
     if update.message:
         mark_logged(context, update.message.message_id)
@@ -1351,59 +1843,54 @@ async def collect_exchange_hash(update: Update, context: CallbackContext) -> int
 
 
 async def collect_exchange_screenshot(update: Update, context: CallbackContext) -> int:
+    user_id = update.effective_user.id
     photo = update.message.photo[-1] if update.message.photo else None
     if not photo:
         await reply_text_logged(update.message, context, "Please send the payment screenshot.")
         return EX_SCREEN
-    file_bytes, file_mime = await fetch_file_bytes(context.bot, photo.file_id)
 
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    exchange_id = await insert_exchange_request(
-        conn,
-        update.effective_user.id,
-        context.user_data.get("exchange_tx_hash", ""),
-        photo.file_id,
-    )
+    conn: DBPool = context.bot_data["db"]
+    now = utc_now()
+    # Queue the log row first so the awaited insert commits it in the same batch.
     await log_user_message(
         conn,
-        update.effective_user.id,
+        user_id,
         "exchange_screenshot",
         file_id=photo.file_id,
-        chat_type=update.effective_chat.type if update.effective_chat else "",
-        file_bytes=file_bytes,
-        file_mime=file_mime,
+        chat_type=_chat_type(update),
+        now=now,
     )
+    exchange_id = await insert_exchange_request(
+        conn,
+        user_id,
+        context.user_data.get("exchange_tx_hash", ""),
+        photo.file_id,
+        now=now,
+    )
+    attach_file_later(context.application, conn, photo.file_id)
     if update.message:
         mark_logged(context, update.message.message_id)
 
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Allow exchange ✅",
-                    callback_data=f"start_ex_approve:{exchange_id}",
-                ),
-                InlineKeyboardButton(
-                    "Reject exchange ❌",
-                    callback_data=f"start_ex_reject:{exchange_id}",
-                ),
-            ]
-        ]
-    )
+    keyboard = build_exchange_request_keyboard(exchange_id)
     username = f"@{update.effective_user.username}" if update.effective_user.username else "No username"
-    user_row = await get_user(conn, update.effective_user.id)
+    user_row = await get_user(conn, user_id)
     info_text = build_user_info_text(user_row, username, prefix=f"Exchange request #{exchange_id}")
-    await send_message_logged(
+    # Both carry the full info text, so the admin can act on whichever arrives first.
+    notify_admin_later(
         context,
-        chat_id=context.bot_data["config"].admin_chat_id,
-        text=info_text,
-        reply_markup=keyboard,
-    )
-    await send_photo_logged(
-        context,
-        chat_id=context.bot_data["config"].admin_chat_id,
-        photo=photo.file_id,
-        caption=info_text,
+        "exchange screenshot",
+        send_message_logged(
+            context,
+            chat_id=context.bot_data["config"].admin_chat_id,
+            text=info_text,
+            reply_markup=keyboard,
+        ),
+        send_photo_logged(
+            context,
+            chat_id=context.bot_data["config"].admin_chat_id,
+            photo=photo.file_id,
+            caption=info_text,
+        ),
     )
 
     await reply_text_logged(update.message, context, "Your request has been submitted. Please wait.")
@@ -1420,10 +1907,10 @@ async def handle_user_approval(update: Update, context: CallbackContext) -> None
     data = query.data
     action, telegram_id_str = data.split(":", 1)
     telegram_id = int(telegram_id_str)
-    conn: aiosqlite.Connection = context.bot_data["db"]
+    conn: DBPool = context.bot_data["db"]
 
     if action == "approve_user":
-        await set_user_status(conn, telegram_id, "approved")
+        await set_user_status(conn, telegram_id, UserStatus.APPROVED)
         await send_message_logged(
             context,
             chat_id=telegram_id,
@@ -1434,12 +1921,7 @@ async def handle_user_approval(update: Update, context: CallbackContext) -> None
                 "After deposit, send tx hash and screenshot.\n"
                 f"For more info, contact: {context.bot_data['config'].contact_email}"
             ),
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("Rules", callback_data="show_rules")],
-                    [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
-                ]
-            ),
+            reply_markup=MAIN_MENU_APPROVED,
         )
         try:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1447,19 +1929,14 @@ async def handle_user_approval(update: Update, context: CallbackContext) -> None
             pass
         await reply_text_logged(query.message, context, f"User {telegram_id} approved.")
     elif action == "reject_user":
-        await set_user_status(conn, telegram_id, "rejected")
+        await set_user_status(conn, telegram_id, UserStatus.REJECTED)
         await send_message_logged(
             context,
             chat_id=telegram_id,
             text=(
                 "Your information was not approved. You can /start again to edit and resubmit your details."
             ),
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("Rules", callback_data="show_rules")],
-                    [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
-                ]
-            ),
+            reply_markup=REJECTED_USER_MARKUP,
         )
         try:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1468,6 +1945,16 @@ async def handle_user_approval(update: Update, context: CallbackContext) -> None
         await reply_text_logged(query.message, context, f"User {telegram_id} rejected.")
 
 
+# What the user is told when the admin flags one of their fields.
+FIELD_ISSUE_MESSAGES = {
+    "name": "Your name seems incorrect. Please enter your correct full name in English.",
+    "idnumber": "Your ID number seems incorrect. Please enter the correct ID number (digits).",
+    "idcard": "Your ID card photo is not clear. Please resend a clear ID card photo.",
+    "selfie": "Your selfie with ID is not clear. Please resend a clear selfie with the ID card.",
+    "email": "Your email seems incorrect. Please enter the correct email.",
+}
+
+
 async def handle_field_issue(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     await query.answer()
@@ -1476,18 +1963,10 @@ async def handle_field_issue(update: Update, context: CallbackContext) -> None:
         return
     _, field_key, telegram_id_str = query.data.split(":", 2)
     telegram_id = int(telegram_id_str)
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    await set_user_status(conn, telegram_id, "needs_update")
-    await set_pending_field(conn, telegram_id, field_key)
-
-    field_messages = {
-        "name": "Your name seems incorrect. Please enter your correct full name in English.",
-        "idnumber": "Your ID number seems incorrect. Please enter the correct ID number (digits).",
-        "idcard": "Your ID card photo is not clear. Please resend a clear ID card photo.",
-        "selfie": "Your selfie with ID is not clear. Please resend a clear selfie with the ID card.",
-        "email": "Your email seems incorrect. Please enter the correct email.",
-    }
-    msg = field_messages.get(
+    conn: DBPool = context.bot_data["db"]
+    await set_review_state(conn, telegram_id, UserStatus.NEEDS_UPDATE, field_key)
+
+    msg = FIELD_ISSUE_MESSAGES.get(
         field_key,
         "There is an issue with your submission. Please resend the correct information.",
     )
@@ -1505,9 +1984,10 @@ async def handle_field_issue(update: Update, context: CallbackContext) -> None:
 
 
 async def payment_handler(update: Update, context: CallbackContext) -> None:
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
-    if not user or user["status"] != "approved":
+    user_id = update.effective_user.id
+    conn: DBPool = context.bot_data["db"]
+    user = await get_user_state(conn, user_id)
+    if not user or user["status"] != UserStatus.APPROVED:
         # Ignore payments from non-approved users to avoid confusing messages during verification updates
         return
 
@@ -1532,20 +2012,21 @@ async def payment_handler(update: Update, context: CallbackContext) -> None:
         return
 
     screenshot_file_id = photo.file_id
-    file_bytes, file_mime = await fetch_file_bytes(context.bot, screenshot_file_id)
     context.user_data.pop("pending_payment_hash", None)
 
-    await insert_payment(conn, update.effective_user.id, tx_hash, screenshot_file_id)
+    now = utc_now()
+    # Queue the log row first so the awaited insert commits it in the same batch.
     await log_user_message(
         conn,
-        update.effective_user.id,
+        user_id,
         "payment",
         content=tx_hash,
         file_id=screenshot_file_id,
-        chat_type=update.effective_chat.type if update.effective_chat else "",
-        file_bytes=file_bytes,
-        file_mime=file_mime,
+        chat_type=_chat_type(update),
+        now=now,
     )
+    await insert_payment(conn, user_id, tx_hash, screenshot_file_id, now=now)
+    attach_file_later(context.application, conn, screenshot_file_id)
     if update.message:
         mark_logged(context, update.message.message_id)
 
@@ -1554,32 +2035,34 @@ async def payment_handler(update: Update, context: CallbackContext) -> None:
             [
                 InlineKeyboardButton(
                     "Approve payment ✅",
-                    callback_data=f"approve_pay:{update.effective_user.id}",
+                    callback_data=f"approve_pay:{user_id}",
                 ),
                 InlineKeyboardButton(
                     "Reject payment ❌",
-                    callback_data=f"reject_pay:{update.effective_user.id}",
+                    callback_data=f"reject_pay:{user_id}",
                 ),
             ]
         ]
     )
     try:
-        await send_message_logged(
-            context,
-            chat_id=context.bot_data["config"].admin_chat_id,
-            text=(
-                f"New payment from user {update.effective_user.id}\n"
-                f"Hash/Note: {tx_hash or '---'}"
+        # photo is always set here, so the text and screenshot go out together.
+        await asyncio.gather(
+            send_message_logged(
+                context,
+                chat_id=context.bot_data["config"].admin_chat_id,
+                text=(
+                    f"New payment from user {user_id}\n"
+                    f"Hash/Note: {tx_hash or '---'}"
+                ),
+                reply_markup=keyboard,
             ),
-            reply_markup=keyboard,
-        )
-        if photo:
-            await send_photo_logged(
+            send_photo_logged(
                 context,
                 chat_id=context.bot_data["config"].admin_chat_id,
                 photo=screenshot_file_id,
-                caption=f"Payment screenshot user {update.effective_user.id}",
-            )
+                caption=f"Payment screenshot user {user_id}",
+            ),
+        )
     except BadRequest as exc:
         logger.error("Failed to send payment to admin: %s", exc)
         await reply_text_logged(update.message, context, 
@@ -1597,14 +2080,10 @@ async def handle_payment_approval(update: Update, context: CallbackContext) -> N
         return
     action, telegram_id_str = query.data.split(":", 1)
     telegram_id = int(telegram_id_str)
-    conn: aiosqlite.Connection = context.bot_data["db"]
+    conn: DBPool = context.bot_data["db"]
 
     if action == "approve_pay":
-        await conn.execute(
-            "UPDATE payments SET status = 'approved' WHERE user_id = ? AND status = 'pending'",
-            (telegram_id,),
-        )
-        await conn.commit()
+        await settle_pending_payments(conn, telegram_id, PayStatus.APPROVED)
         await send_message_logged(
             context,
             chat_id=telegram_id,
@@ -1615,11 +2094,7 @@ async def handle_payment_approval(update: Update, context: CallbackContext) -> N
         )
         await query.edit_message_text(f"Payment of user {telegram_id} approved.")
     elif action == "reject_pay":
-        await conn.execute(
-            "UPDATE payments SET status = 'rejected' WHERE user_id = ? AND status = 'pending'",
-            (telegram_id,),
-        )
-        await conn.commit()
+        await settle_pending_payments(conn, telegram_id, PayStatus.REJECTED)
         await send_message_logged(
             context,
             chat_id=telegram_id,
@@ -1631,14 +2106,15 @@ async def handle_payment_approval(update: Update, context: CallbackContext) -> N
 async def handle_exchange_approval(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     await query.answer()
-    if update.effective_user.id != context.bot_data["config"].admin_chat_id:
+    admin_id = update.effective_user.id
+    if admin_id != context.bot_data["config"].admin_chat_id:
         await query.edit_message_text("Access denied.")
         return
 
     action, ex_id_str = query.data.split(":", 1)
     exchange_id = int(ex_id_str)
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    exchange = await get_exchange(conn, exchange_id)
+    conn: DBPool = context.bot_data["db"]
+    exchange = await get_exchange_with_user(conn, exchange_id)
     if not exchange:
         await query.edit_message_text("Exchange request not found.")
         return
@@ -1646,14 +2122,13 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
     user_id = exchange["user_id"]
 
     if action in {"start_ex_approve", "approve_ex"}:
-        approved_at = datetime.now(UTC)
         await set_exchange_status(
             conn,
             exchange_id,
-            "awaiting_wallet",
-            approved_at=approved_at.isoformat(),
+            ExStatus.AWAITING_WALLET,
+            approved_at=utc_now(),
         )
-        context.bot_data.setdefault("wallet_flow", {})[update.effective_user.id] = {
+        context.bot_data["wallet_flow"][admin_id] = {
             "exchange_id": exchange_id,
             "user_id": user_id,
             "stage": "wait_wallet",
@@ -1666,8 +2141,8 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
             f"Send deposit wallet address for exchange #{exchange_id} (user {user_id})."
         )
     elif action == "confirm_ex_pay":
-        await set_exchange_status(conn, exchange_id, "awaiting_user_wallet")
-        context.bot_data.setdefault("payout_wallet_collect", {})[user_id] = {
+        await set_exchange_status(conn, exchange_id, ExStatus.AWAITING_USER_WALLET)
+        context.bot_data["payout_wallet_collect"][user_id] = {
             "exchange_id": exchange_id
         }
         try:
@@ -1687,8 +2162,8 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
             ),
         )
     elif action == "reject_ex_pay":
-        await set_exchange_status(conn, exchange_id, "rejected")
-        context.bot_data.setdefault("payout_wallet_collect", {}).pop(user_id, None)
+        await set_exchange_status(conn, exchange_id, ExStatus.REJECTED)
+        context.bot_data["payout_wallet_collect"].pop(user_id, None)
         try:
             await query.edit_message_reply_markup(reply_markup=None)
         except BadRequest:
@@ -1700,17 +2175,12 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
         )
         await reply_text_logged(query.message, context, f"Exchange request #{exchange_id} rejected after review.")
     elif action in {"start_ex_reject", "reject_ex"}:
-        await set_exchange_status(conn, exchange_id, "rejected")
+        await set_exchange_status(conn, exchange_id, ExStatus.REJECTED)
         await send_message_logged(
             context,
             chat_id=user_id,
             text="Your exchange request was rejected. You can try again via Exchange.",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("Rules", callback_data="show_rules")],
-                    [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
-                ]
-            ),
+            reply_markup=MAIN_MENU_APPROVED,
         )
         try:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1719,13 +2189,10 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
         await reply_text_logged(query.message, context, f"Exchange request #{exchange_id} rejected.")
     elif action == "send_ex":
         # begin payout flow for admin: request tx hash then screenshot
-        admin_id = update.effective_user.id
-        user_wallet_addr = (
-            exchange["user_wallet_address"] if "user_wallet_address" in exchange.keys() else None
-        )
-        if exchange["status"] not in {"awaiting_payout"}:
+        user_wallet_addr = exchange["user_wallet_address"]
+        if exchange["status"] != ExStatus.AWAITING_PAYOUT:
             await reply_text_logged(query.message, context, 
-                f"Exchange #{exchange_id} is in status '{exchange['status']}'. Cannot start payout."
+                f"Exchange #{exchange_id} is in status '{status_label(ExStatus, exchange['status'])}'. Cannot start payout."
             )
             return
         if not user_wallet_addr:
@@ -1733,14 +2200,14 @@ async def handle_exchange_approval(update: Update, context: CallbackContext) ->
                 f"Payout wallet for exchange #{exchange_id} not received yet."
             )
             return
-        context.bot_data.setdefault("payout_flow", {})[admin_id] = {
+        context.bot_data["payout_flow"][admin_id] = {
             "exchange_id": exchange_id,
             "user_id": user_id,
             "user_wallet": user_wallet_addr,
             "stage": "wait_hash_or_photo",
         }
-        user_row = await get_user(conn, user_id)
-        username = user_row["username"] if user_row and user_row["username"] else "No username"
+        user_row = exchange if exchange["telegram_id"] is not None else None
+        username = exchange["username"] or "No username"
         info_text = build_user_info_text(user_row, username, prefix=f"Exchange #{exchange_id}")
         try:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -1761,22 +2228,17 @@ async def expire_exchange_request(context: CallbackContext) -> None:
     user_id = data.get("user_id")
     if exchange_id is None or user_id is None:
         return
-    conn: aiosqlite.Connection = context.bot_data["db"]
+    conn: DBPool = context.bot_data["db"]
     exchange = await get_exchange(conn, exchange_id)
-    if not exchange or exchange["status"] != "awaiting_transfer":
+    if not exchange or exchange["status"] != ExStatus.AWAITING_TRANSFER:
         return
-    await set_exchange_status(conn, exchange_id, "expired")
+    await set_exchange_status(conn, exchange_id, ExStatus.EXPIRED)
     try:
         await send_message_logged(
             context,
             chat_id=user_id,
             text="Your exchange request expired. Please try again via Exchange.",
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [InlineKeyboardButton("📜 Rules", callback_data="show_rules")],
-                    [InlineKeyboardButton("🔄 Exchange", callback_data="show_exchange")],
-                ]
-            ),
+            reply_markup=RULES_EXCHANGE_MARKUP,
         )
     except Exception as exc:  # pragma: no cover
         logger.error("Failed to notify user on expiration: %s", exc)
@@ -1787,56 +2249,93 @@ async def error_handler(update: Optional[Update], context: CallbackContext) -> N
 
 
 async def status_cmd(update: Update, context: CallbackContext) -> None:
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    user = await get_user(conn, update.effective_user.id)
+    conn: DBPool = context.bot_data["db"]
+    user = await get_user_state(conn, update.effective_user.id)
     if not user:
         await reply_text_logged(update.message, context, "Please /start first.")
         return
-    await reply_text_logged(update.message, context, f"Your status: {user['status']}")
+    await reply_text_logged(update.message, context, f"Your status: {status_label(UserStatus, user['status'])}")
 
 
-def build_main_menu(status: str) -> InlineKeyboardMarkup:
-    if status == "approved":
-        buttons = [
-            [InlineKeyboardButton("Rules", callback_data="show_rules")],
-            [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
-        ]
-    else:
-        buttons = [
-            [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
-            [InlineKeyboardButton("Rules", callback_data="show_rules")],
-        ]
-    return InlineKeyboardMarkup(buttons)
+# Keyboards that never change are built once; PTB's Telegram objects are frozen,
+# so one instance can go out with any number of messages.
+MAIN_MENU_APPROVED = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Rules", callback_data="show_rules")],
+        [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
+    ]
+)
+MAIN_MENU_NEW = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
+        [InlineKeyboardButton("Rules", callback_data="show_rules")],
+    ]
+)
+RULES_MENU_APPROVED = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
+        [InlineKeyboardButton("Back", callback_data="back_to_menu")],
+    ]
+)
+RULES_MENU_NEW = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
+        [InlineKeyboardButton("Back", callback_data="back_to_menu")],
+    ]
+)
+RULES_EXCHANGE_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("📜 Rules", callback_data="show_rules")],
+        [InlineKeyboardButton("🔄 Exchange", callback_data="show_exchange")],
+    ]
+)
+REJECTED_USER_MARKUP = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton("Rules", callback_data="show_rules")],
+        [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
+    ]
+)
+UPDATE_MENU_MARKUP = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("Update name", callback_data="update_name"),
+            InlineKeyboardButton("Update ID number", callback_data="update_idnum"),
+        ],
+        [
+            InlineKeyboardButton("Update ID card photo", callback_data="update_idcard"),
+            InlineKeyboardButton("Update selfie with ID", callback_data="update_selfie"),
+        ],
+        [
+            InlineKeyboardButton("Update email", callback_data="update_email"),
+            InlineKeyboardButton("Rules", callback_data="show_rules"),
+        ],
+    ]
+)
 
 
-def build_rules_menu(status: str) -> InlineKeyboardMarkup:
-    if status == "approved":
-        return InlineKeyboardMarkup(
-            [
-                [InlineKeyboardButton("Exchange", callback_data="show_exchange")],
-                [InlineKeyboardButton("Back", callback_data="back_to_menu")],
-            ]
-        )
-    return InlineKeyboardMarkup(
-        [
-            [InlineKeyboardButton("Verify & Start", callback_data="begin_auth")],
-            [InlineKeyboardButton("Back", callback_data="back_to_menu")],
-        ]
-    )
+def build_main_menu(status: Optional[int]) -> InlineKeyboardMarkup:
+    return MAIN_MENU_APPROVED if status == UserStatus.APPROVED else MAIN_MENU_NEW
+
+
+def build_rules_menu(status: Optional[int]) -> InlineKeyboardMarkup:
+    return RULES_MENU_APPROVED if status == UserStatus.APPROVED else RULES_MENU_NEW
+
+
+# Prompt and conversation state for each button of the update menu.
+UPDATE_FIELD_PROMPTS = {
+    "name": ("Please enter your full name:", NAME),
+    "idnum": ("Enter your ID number:", ID_NUMBER),
+    "idcard": ("Please send a photo of your ID card:", ID_CARD_PHOTO),
+    "selfie": ("Send a photo of yourself holding the ID card:", SELFIE_WITH_ID),
+    "email": ("Enter your email address:", EMAIL),
+}
 
 
 async def update_field_choice(update: Update, context: CallbackContext) -> int:
     query = update.callback_query
     await query.answer()
     _, field_key = query.data.split("_", 1)
-    mapping = {
-        "name": ("Please enter your full name:", NAME),
-        "idnum": ("Enter your ID number:", ID_NUMBER),
-        "idcard": ("Please send a photo of your ID card:", ID_CARD_PHOTO),
-        "selfie": ("Send a photo of yourself holding the ID card:", SELFIE_WITH_ID),
-        "email": ("Enter your email address:", EMAIL),
-    }
-    prompt, state = mapping.get(field_key, ("Please enter your full name:", NAME))
+    prompt, state = UPDATE_FIELD_PROMPTS.get(field_key, UPDATE_FIELD_PROMPTS["name"])
     try:
         await query.edit_message_text(prompt)
     except BadRequest as exc:
@@ -1845,29 +2344,29 @@ async def update_field_choice(update: Update, context: CallbackContext) -> int:
 
 
 async def send_update_menu(query, user_row) -> None:
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton("Update name", callback_data="update_name"),
-                InlineKeyboardButton("Update ID number", callback_data="update_idnum"),
-            ],
-            [
-                InlineKeyboardButton("Update ID card photo", callback_data="update_idcard"),
-                InlineKeyboardButton("Update selfie with ID", callback_data="update_selfie"),
-            ],
-            [
-                InlineKeyboardButton("Update email", callback_data="update_email"),
-                InlineKeyboardButton("Rules", callback_data="show_rules"),
-            ],
-        ]
-    )
     text = "You have a pending update request. Choose the field to update."
     try:
-        await query.edit_message_text(text, reply_markup=keyboard)
+        await query.edit_message_text(text, reply_markup=UPDATE_MENU_MARKUP)
     except BadRequest as exc:
         logger.debug("Skip edit_message_text (already set): %s", exc)
 
 
+def build_exchange_request_keyboard(exchange_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton("Allow exchange ✅", callback_data=f"start_ex_approve:{exchange_id}"),
+                InlineKeyboardButton("Reject exchange ❌", callback_data=f"start_ex_reject:{exchange_id}"),
+            ]
+        ]
+    )
+
+
+# Markups are frozen, so one per user can be reused for every resubmission.
+VERIFICATION_KEYBOARDS_MAX = 4096
+
+
+@lru_cache(maxsize=VERIFICATION_KEYBOARDS_MAX)
 def build_verification_keyboard(user_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         [
@@ -1891,14 +2390,14 @@ def build_verification_keyboard(user_id: int) -> InlineKeyboardMarkup:
 def build_user_info_text(user_row: Optional[aiosqlite.Row], username: str, prefix: str = "New verification request:") -> str:
     if not user_row:
         return f"{prefix}\n(No user data found)"
-    get = lambda key: user_row[key] if key in user_row.keys() else None
+    # Callers pass full users rows or the exchange gate row; both carry these columns.
     return (
         f"{prefix}\n"
-        f"Name: {get('name') or 'N/A'}\n"
-        f"ID number: {get('id_number') or 'N/A'}\n"
-        f"Email: {get('email') or 'N/A'}\n"
+        f"Name: {user_row['name'] or 'N/A'}\n"
+        f"ID number: {user_row['id_number'] or 'N/A'}\n"
+        f"Email: {user_row['email'] or 'N/A'}\n"
         f"Username: {username or 'No username'}\n"
-        f"user_id: {get('telegram_id')}"
+        f"user_id: {user_row['telegram_id']}"
     )
 
 
@@ -1910,48 +2409,21 @@ async def send_full_info_to_admin(
     keyboard: Optional[InlineKeyboardMarkup] = None,
     prefix: str = "New verification request:",
 ) -> None:
-    conn: aiosqlite.Connection = context.bot_data["db"]
+    conn: DBPool = context.bot_data["db"]
     user_row = await get_user(conn, user_id)
     username = user_row["username"] if user_row and user_row["username"] else "No username"
     info_text = build_user_info_text(user_row, username, prefix=prefix)
-    try:
-        await send_message_logged(
-            context,
-            chat_id=context.bot_data["config"].admin_chat_id,
-            text=info_text,
-            reply_markup=keyboard,
-        )
-        if id_card_file_id:
-            await send_photo_logged(
-                context,
-                chat_id=context.bot_data["config"].admin_chat_id,
-                photo=id_card_file_id,
-                caption=info_text,
-            )
-        if selfie_file_id:
-            await send_photo_logged(
-                context,
-                chat_id=context.bot_data["config"].admin_chat_id,
-                photo=selfie_file_id,
-                caption=info_text,
-            )
-    except BadRequest as exc:
-        logger.error("Failed to send admin notification: %s", exc)
-
-
-def is_english_name(text: str) -> bool:
-    if not text:
-        return False
-    allowed_extra = set(" -'")
-    has_letter = False
-    for ch in text:
-        if ch.isascii() and ch.isalpha():
-            has_letter = True
-            continue
-        if ch in allowed_extra:
-            continue
-        return False
-    return has_letter
+    admin_chat_id = context.bot_data["config"].admin_chat_id
+    # Every message carries the info text, so their arrival order does not matter.
+    sends = [send_message_logged(context, chat_id=admin_chat_id, text=info_text, reply_markup=keyboard)]
+    for file_id in (id_card_file_id, selfie_file_id):
+        if file_id:
+            sends.append(send_photo_logged(context, chat_id=admin_chat_id, photo=file_id, caption=info_text))
+    for result in await asyncio.gather(*sends, return_exceptions=True):
+        if isinstance(result, BadRequest):
+            logger.error("Failed to send admin notification: %s", result)
+        elif isinstance(result, BaseException):
+            raise result
 
 
 async def notify_admin_field_update(
@@ -1986,11 +2458,11 @@ async def notify_admin_field_update(
 
 
 async def finalize_pending_update(
-    context: CallbackContext, existing_user: aiosqlite.Row, field_label: str, value: str = "", file_id: str = ""
+    context: CallbackContext, existing_user: aiosqlite.Row, field_label: str, column: str, value: str
 ) -> None:
-    conn: aiosqlite.Connection = context.bot_data["db"]
-    await set_pending_field(conn, existing_user["telegram_id"], None)
-    await set_user_status(conn, existing_user["telegram_id"], "pending")
+    conn: DBPool = context.bot_data["db"]
+    await resubmit_user_field(conn, existing_user["telegram_id"], column, value)
+    file_id = value if column in ("id_card_file_id", "selfie_with_id_file_id") else ""
     await send_full_info_to_admin(
         context,
         user_id=existing_user["telegram_id"],
@@ -2007,15 +2479,30 @@ def main() -> None:
     async def post_init(app: Application) -> None:
         app.bot_data["db"] = await init_db()
         app.bot_data["config"] = config
+        for flow_key in FLOW_KEYS:
+            app.bot_data.setdefault(flow_key, {})
+        app.bot_data["chat_limiters"] = OrderedDict()
+
+    async def post_shutdown(app: Application) -> None:
+        db: Optional[DBPool] = app.bot_data.get("db")
+        if db:
+            await db.close()
 
     application: Application = (
         ApplicationBuilder()
         .token(config.bot_token)
+        # Bursts of admin/user sends share one multiplexed connection instead of
+        # opening more pooled ones; long polling keeps its own HTTP/1.1 connection.
+        .http_version("2")
         .rate_limiter(AIORateLimiter())
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
+    # Filters are composed once and shared by every handler that needs them.
+    not_command = filters.ALL & ~filters.COMMAND
+    text_not_command = filters.TEXT & ~filters.COMMAND
     conv = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
@@ -2025,12 +2512,12 @@ def main() -> None:
                 CallbackQueryHandler(show_exchange, pattern="^show_exchange$"),
                 CallbackQueryHandler(update_field_choice, pattern="^update_(name|idnum|idcard|selfie|email)$"),
             ],
-            NAME: [MessageHandler(filters.ALL & ~filters.COMMAND, collect_name)],
-            ID_CARD_PHOTO: [MessageHandler(filters.ALL & ~filters.COMMAND, collect_id_card)],
-            ID_NUMBER: [MessageHandler(filters.ALL & ~filters.COMMAND, collect_id_number)],
-            SELFIE_WITH_ID: [MessageHandler(filters.ALL & ~filters.COMMAND, collect_selfie_with_id)],
-            EMAIL: [MessageHandler(filters.ALL & ~filters.COMMAND, collect_email)],
-            EX_HASH: [MessageHandler(filters.TEXT & ~filters.COMMAND, collect_exchange_hash)],
+            NAME: [MessageHandler(not_command, collect_name)],
+            ID_CARD_PHOTO: [MessageHandler(not_command, collect_id_card)],
+            ID_NUMBER: [MessageHandler(not_command, collect_id_number)],
+            SELFIE_WITH_ID: [MessageHandler(not_command, collect_selfie_with_id)],
+            EMAIL: [MessageHandler(not_command, collect_email)],
+            EX_HASH: [MessageHandler(text_not_command, collect_exchange_hash)],
             EX_SCREEN: [MessageHandler(filters.PHOTO, collect_exchange_screenshot)],
         },
         fallbacks=[CommandHandler("start", start)],
@@ -2055,11 +2542,11 @@ def main() -> None:
     application.add_handler(CallbackQueryHandler(show_exchange, pattern="^show_exchange$"), group=2)
     # Handle user resubmissions for fields flagged by admin before other message handlers
     application.add_handler(
-        MessageHandler(filters.ALL & ~filters.COMMAND, handle_pending_update),
+        MessageHandler(not_command, handle_pending_update),
     )
     application.add_handler(
         MessageHandler(
-            (filters.PHOTO | (filters.TEXT & ~filters.COMMAND)),
+            filters.PHOTO | text_not_command,
             payment_handler,
         )
     )
@@ -2069,7 +2556,9 @@ def main() -> None:
 
     logger.info("Bot starting in %s mode", config.mode)
 
-    loop = asyncio.new_event_loop()
+    # PTB runs on asyncio.get_event_loop(), so the loop is still set explicitly;
+    # uvloop's is used where it is installed.
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
 
     try: